@@ -0,0 +1,197 @@
+import collections
+import hashlib
+import numpy as np
+import os
+import tempfile
+import threading
+from ami_game.game import multichoose, multichoose_chunks, \
+        number_of_strategies
+
+# Version of the file format, part of every key so that files of older
+# versions are never read
+FORMAT_VERSION = 1
+
+class StrategyCache(object):
+    ''' Class caching enumerated strategy spaces in memory and on disk.
+
+    A strategy space only depends on the number of nodes N and the number of
+    units distributed, so it is stored once as unit counts, the output of
+    multichoose in the smallest unsigned integer type, and shared by every
+    game and player with the same (N, units), e.g. the attacker and the
+    defender if their budgets match. Files are named by a hash of their key,
+    written atomically and memory-mapped read-only on load, so a cache
+    directory can be shared by concurrent runs. Entries are evicted in
+    least recently used order, both from memory and from disk, to keep each
+    below a size bound '''
+
+    def __init__(self, directory=None, max_bytes=2**32, memory_bytes=2**30):
+        ''' Constructor for the StrategyCache class
+
+        Arguments:
+
+        directory: the directory of the cache files, created if needed. The
+                   cache is held in memory only if not given
+        max_bytes: the largest total size of the cache files. Strategy
+                   spaces larger than this are not written to disk
+        memory_bytes: the largest total size of the strategy spaces kept
+                      referenced in memory. Memory-mapped spaces count with
+                      their file size. The most recently used space is
+                      always kept
+        '''
+        self.directory = None if directory is None \
+                else os.path.expanduser(directory)
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.entries = collections.OrderedDict()
+        # Temporary files being written by this object, the only ones clear
+        # may remove as those of other processes are still in use
+        self.temporaries = set()
+        self.lock = threading.Lock()
+
+    def strategies(self, N, units):
+        ''' Returns all strategies distributing units over N nodes as a
+        read-only integer numpy array of dimensions <number of strategies> x
+        <N> in the order of multichoose, from memory, from disk or
+        enumerated and stored in the cache '''
+        key = (N, units)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            strategies = self.load(N, units)
+            if strategies is None:
+                strategies = self.enumerate(N, units)
+            self.entries[key] = strategies
+            self.evict_memory()
+            return strategies
+
+    def filename(self, N, units):
+        ''' Returns the path of the cache file of a strategy space, named by
+        a hash of its key '''
+        digest = hashlib.sha256(repr(('multichoose', FORMAT_VERSION, N, units,
+                np.min_scalar_type(units).str)).encode('ascii')).hexdigest()
+        return os.path.join(self.directory, 'strategies_'+digest[:32]+'.npy')
+
+    def load(self, N, units):
+        ''' Returns the strategy space memory-mapped from its cache file, or
+        None if the cache holds no file of it, including when the file is
+        evicted by a concurrent run while loading '''
+        if self.directory is None:
+            return None
+        filename = self.filename(N, units)
+        try:
+            strategies = np.load(filename, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if strategies.shape != (number_of_strategies(N, units), N):
+            return None
+        # The access time orders the files for eviction
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+        return strategies
+
+    def enumerate(self, N, units):
+        ''' Enumerates a strategy space, writes it to the cache directory if
+        it fits and returns it '''
+        dtype = np.min_scalar_type(units)
+        shape = (number_of_strategies(N, units), N)
+        if self.directory is None \
+                or shape[0]*N*dtype.itemsize > self.max_bytes:
+            strategies = multichoose(N, units, dtype)
+            strategies.flags.writeable = False
+            return strategies
+        # Enumerate chunk by chunk into a temporary file that is renamed when
+        # complete, so that no process reads a partial file
+        fd, temporary = tempfile.mkstemp(prefix='strategies_',
+                suffix='.tmp', dir=self.directory)
+        os.close(fd)
+        self.temporaries.add(temporary)
+        try:
+            strategies = np.lib.format.open_memmap(temporary, mode='w+',
+                    dtype=dtype, shape=shape)
+            start = 0
+            for chunk in multichoose_chunks(N, units, dtype=dtype):
+                strategies[start:start+chunk.shape[0]] = chunk
+                start += chunk.shape[0]
+            strategies.flush()
+            del strategies
+            os.replace(temporary, self.filename(N, units))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        finally:
+            self.temporaries.discard(temporary)
+        # Map the file before evicting, so that only a concurrent run can
+        # remove it first, in which case the space is enumerated in memory
+        strategies = self.load(N, units)
+        self.evict_files()
+        if strategies is None:
+            strategies = multichoose(N, units, dtype)
+            strategies.flags.writeable = False
+        return strategies
+
+    def evict_memory(self):
+        ''' Drops the least recently used strategy spaces from memory until
+        the rest fit in memory_bytes '''
+        total = sum(strategies.nbytes for strategies in self.entries.values())
+        while len(self.entries) > 1 and total > self.memory_bytes:
+            _, strategies = self.entries.popitem(last=False)
+            total -= strategies.nbytes
+
+    def evict_files(self):
+        ''' Removes the least recently used cache files until the rest fit
+        in max_bytes. Spaces that are memory-mapped stay readable until they
+        are released '''
+        files = []
+        for name in os.listdir(self.directory):
+            if name.startswith('strategies_') and name.endswith('.npy'):
+                path = os.path.join(self.directory, name)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue
+                files.append((status.st_mtime, status.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        ''' Removes every strategy space from memory and from disk. Only
+        the temporary files of this object are removed, those of concurrent
+        runs are left to them '''
+        with self.lock:
+            self.entries.clear()
+            if self.directory is None:
+                return
+            paths = [os.path.join(self.directory, name)
+                     for name in os.listdir(self.directory)
+                     if name.startswith('strategies_')
+                     and name.endswith('.npy')]
+            for path in paths + list(self.temporaries):
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Already removed by a concurrent run
+                    pass
+            self.temporaries.clear()
+
+_default_cache = None
+
+def default_cache():
+    ''' Returns the cache shared by the runs of a user, in the directory
+    given by the environment variable AMI_GAME_CACHE or ~/.cache/ami_game '''
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = StrategyCache(os.environ.get('AMI_GAME_CACHE',
+                os.path.join('~', '.cache', 'ami_game')))
+    return _default_cache
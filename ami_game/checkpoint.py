@@ -0,0 +1,111 @@
+import numpy as np
+import os
+from ami_game.ensemble import PopulationEnsemble
+from ami_game.population import Population
+
+# Version of the checkpoint layout, stored with every checkpoint
+CHECKPOINT_VERSION = 1
+
+def save_checkpoint(population, filename):
+    ''' Saves the mutable state of a Population to a .npz file: the
+    population distributions, generation counter, replicator settings, the
+    state of the random number generator and a fingerprint of the game.
+    The game and its strategy spaces are not stored, they are reproduced
+    from the case definition when resuming. The file is replaced atomically,
+    so a run interrupted while saving keeps its previous checkpoint.
+
+    Arguments:
+
+    population: a Population or PopulationEnsemble object
+    filename: name of the checkpoint file
+    '''
+    rng_state = np.random.get_state()
+    state = {
+        'version': CHECKPOINT_VERSION,
+        'fingerprint': population.game.fingerprint(),
+        'attacker_population': population.attacker_population,
+        'defender_population': population.defender_population,
+        'generation': population.generation,
+        'time': population.time,
+        'replicator': population.replicator,
+        'payoff': population.payoff,
+        'integrator': population.integrator,
+        'k': population.k,
+        'dt': population.dt,
+        'noise_step': population.noise_step,
+        'delta': population.delta,
+        'tolerance': population.tolerance,
+        'incremental': population.incremental,
+        'refresh_interval': population.refresh_interval,
+        'rng_keys': rng_state[1],
+        'rng_position': rng_state[2],
+        'rng_has_gauss': rng_state[3],
+        'rng_cached_gaussian': rng_state[4]}
+    if hasattr(population, 'average_utility_attacker'):
+        state['average_utility_attacker'] = \
+                population.average_utility_attacker
+        state['average_utility_defender'] = \
+                population.average_utility_defender
+    if getattr(population, 'attacker_payoffs', None) is not None:
+        # Incrementally maintained payoffs, stored so that resuming does not
+        # change their round-off
+        state['attacker_payoffs'] = population.attacker_payoffs
+        state['defender_payoffs'] = population.defender_payoffs
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as f:
+        np.savez(f, **state)
+    os.replace(temporary, filename)
+
+def load_checkpoint(filename, game):
+    ''' Returns the Population saved in a checkpoint, attached to a game
+    that has been set up again from the case definition, and restores the
+    state of the random number generator
+
+    Arguments:
+
+    filename: name of the checkpoint file
+    game: a ConfidentialityGame object identical to the one of the saved
+          population
+    '''
+    with np.load(filename) as checkpoint:
+        if int(checkpoint['version']) != CHECKPOINT_VERSION:
+            raise ValueError('Unsupported checkpoint version: '
+                    +str(checkpoint['version']))
+        if str(checkpoint['fingerprint']) != game.fingerprint():
+            raise ValueError('The checkpoint was saved for a different game')
+        attacker_population = checkpoint['attacker_population']
+        defender_population = checkpoint['defender_population']
+        settings = {'replicator': str(checkpoint['replicator']),
+                    'k': float(checkpoint['k']),
+                    'dt': float(checkpoint['dt']),
+                    'payoff': str(checkpoint['payoff']),
+                    'dtype': attacker_population.dtype}
+        if attacker_population.ndim == 2:
+            population = PopulationEnsemble(game, attacker_population,
+                    defender_population, **settings)
+        else:
+            population = Population(game, attacker_population,
+                    defender_population,
+                    integrator=str(checkpoint['integrator']),
+                    tolerance=float(checkpoint['tolerance']),
+                    incremental=bool(checkpoint['incremental']),
+                    refresh_interval=int(checkpoint['refresh_interval']),
+                    **settings)
+        population.delta = float(checkpoint['delta'])
+        if 'noise_step' in checkpoint:
+            population.noise_step = float(checkpoint['noise_step'])
+        population.generation = int(checkpoint['generation'])
+        population.time = float(checkpoint['time'])
+        if 'average_utility_attacker' in checkpoint:
+            population.average_utility_attacker = \
+                    checkpoint['average_utility_attacker'][()]
+            population.average_utility_defender = \
+                    checkpoint['average_utility_defender'][()]
+        if 'attacker_payoffs' in checkpoint:
+            population.attacker_payoffs = checkpoint['attacker_payoffs']
+            population.defender_payoffs = checkpoint['defender_payoffs']
+        np.random.set_state(('MT19937', checkpoint['rng_keys'],
+                int(checkpoint['rng_position']),
+                int(checkpoint['rng_has_gauss']),
+                float(checkpoint['rng_cached_gaussian'])))
+    return population
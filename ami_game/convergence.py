@@ -0,0 +1,85 @@
+import numpy as np
+
+class ConvergenceMonitor(object):
+    ''' Class detecting when the attacker and defender populations of a
+    Population have stopped moving '''
+
+    def __init__(self, tolerance=1e-3, utility_tolerance=1e-3, patience=10,
+                 window=1):
+        ''' Constructor for the ConvergenceMonitor class
+
+        Arguments:
+
+        tolerance: the largest change of a population distribution between
+                   two windows, measured as the sum of absolute changes,
+                   that counts as settled
+        utility_tolerance: the largest change of an average utility between
+                           two windows that counts as settled
+        patience: the number of consecutive settled windows required
+        window: the number of generations averaged before comparing. Values
+                above one keep the random noise of the REQN replicator from
+                masking that the dynamics have settled
+        '''
+        self.tolerance = tolerance
+        self.utility_tolerance = utility_tolerance
+        self.patience = patience
+        self.window = window
+        self.settled = 0
+        self.previous = None
+        self.total = None
+        self.count = 0
+
+    def update(self, population):
+        ''' Records the current state of a population and returns True once
+        it has been settled for patience consecutive windows
+
+        Arguments:
+
+        population: a Population or PopulationEnsemble object, after
+                    calculate_utilities or replicate has been called
+        '''
+        state = (population.attacker_population,
+                 population.defender_population,
+                 population.get_average_attacker_utility(),
+                 population.get_average_defender_utility())
+        if self.total is None:
+            self.total = [np.array(value, dtype=float) for value in state]
+        else:
+            for total, value in zip(self.total, state):
+                total += value
+        self.count += 1
+        if self.count < self.window:
+            return self.converged()
+        current = [total/self.count for total in self.total]
+        self.total = None
+        self.count = 0
+        if self.previous is not None and self.is_settled(self.previous,
+                                                         current):
+            self.settled += 1
+        else:
+            self.settled = 0
+        self.previous = current
+        return self.converged()
+
+    def __call__(self, population):
+        ''' Same as update, so that the monitor can be passed to
+        Population.run as an observer that stops the run on convergence '''
+        return self.update(population)
+
+    def is_settled(self, previous, current):
+        ''' Returns True if the change between the states averaged over two
+        windows is within the tolerances, for every replicate of an
+        ensemble '''
+        return np.all(np.sum(np.abs(current[0]-previous[0]), axis=-1)
+                      <= self.tolerance) \
+                and np.all(np.sum(np.abs(current[1]-previous[1]), axis=-1)
+                           <= self.tolerance) \
+                and np.all(np.abs(current[2]-previous[2])
+                           <= self.utility_tolerance) \
+                and np.all(np.abs(current[3]-previous[3])
+                           <= self.utility_tolerance)
+
+    def converged(self):
+        ''' Returns True if the populations have been settled for patience
+        consecutive windows '''
+        return self.settled >= self.patience
@@ -0,0 +1,229 @@
+import numpy as np
+from ami_game.population import Population, tie_ranks
+
+class PopulationEnsemble(Population):
+    ''' Class for an ensemble of independent replicates of the attacker and
+    defender populations in the same game. The replicates share the strategy
+    spaces and payoff data of the game and are advanced together, so that
+    every generation is a handful of matrix-matrix products '''
+
+    def __init__(self, game, attacker_distributions, defender_distributions,
+                    replicator='REQN', k=0.2, dt=0.1, delta=0.1,
+                    payoff='profile', instrument=False, dtype=np.float64):
+        ''' Constructor for the PopulationEnsemble class
+
+        Arguments:
+
+        game: a Game object
+        attacker_distributions: numpy array of size <number of replicates> x
+                                <number of strategies> where each row is a
+                                normalized attacker population distribution
+        defender_distributions: numpy array of size <number of replicates> x
+                                <number of strategies> where each row is a
+                                normalized defender population distribution
+        replicator, k, dt, delta, instrument, dtype: as for Population
+        payoff: 'matrix' or 'profile', see Population. The per-strategy
+                'direct' evaluation is not supported by the ensemble
+
+        '''
+        if payoff == 'direct':
+            raise ValueError('The ensemble requires matrix or profile payoffs')
+        attacker_distributions = np.atleast_2d(attacker_distributions)
+        defender_distributions = np.atleast_2d(defender_distributions)
+        if attacker_distributions.shape[0] != defender_distributions.shape[0]:
+            raise ValueError('The number of attacker and defender replicates '
+                    'must match')
+        Population.__init__(self, game, attacker_distributions[0],
+                defender_distributions[0], replicator=replicator, k=k, dt=dt,
+                delta=delta, payoff=payoff, instrument=instrument,
+                dtype=dtype)
+        self.replicates = attacker_distributions.shape[0]
+        self.attacker_population = np.asarray(attacker_distributions,
+                dtype=self.dtype)
+        self.defender_population = np.asarray(defender_distributions,
+                dtype=self.dtype)
+        # Every replicate has its own support, so all strategies are ranked
+        self.attacker_support = None
+        self.defender_support = None
+
+    def calculate_utilities(self):
+        ''' Calculates the average utilities of every replicate for both
+        attackers and defenders. Returns the expected payoffs of every
+        strategy in every replicate that the averages were computed from '''
+        with self.instrumentation.phase('payoffs'):
+            payoffs_attacker = self.expected_payoffs_attacker()
+            payoffs_defender = self.expected_payoffs_defender()
+        with self.instrumentation.phase('averaging'):
+            self.average_utility_attacker = np.sum(
+                    payoffs_attacker*self.attacker_population, axis=1)
+            self.average_utility_defender = np.sum(
+                    payoffs_defender*self.defender_population, axis=1)
+        return payoffs_attacker, payoffs_defender
+
+    def replicate(self):
+        ''' Updates the attacker and defender populations of every replicate
+        using the method given in the class variable replicator '''
+        instrumentation = self.instrumentation
+        self.generation += 1
+        instrumentation.count('generations')
+        payoffs_attacker, payoffs_defender = self.calculate_utilities()
+        if self.replicator == 'REQN':
+            with instrumentation.phase('update'):
+                dp_s = self.attacker_population*(payoffs_attacker \
+                        - self.average_utility_attacker[:, np.newaxis])
+                dp_t = self.defender_population*(payoffs_defender \
+                        - self.average_utility_defender[:, np.newaxis])
+                self.attacker_population = self.attacker_population \
+                        + self.dt*dp_s
+                self.defender_population = self.defender_population \
+                        + self.dt*dp_t
+                self.time += self.dt
+
+            # Add random fluctuation, drawn independently for each replicate
+            with instrumentation.phase('noise'):
+                N_A = self.attacker_population.shape[1]
+                N_D = self.defender_population.shape[1]
+                self.attacker_population += self.delta\
+                        *np.random.rand(self.replicates, N_A)\
+                        *self.attacker_multiplicities\
+                        /np.sum(self.attacker_multiplicities)
+                self.defender_population += self.delta\
+                        *np.random.rand(self.replicates, N_D)\
+                        *self.defender_multiplicities\
+                        /np.sum(self.defender_multiplicities)
+
+            with instrumentation.phase('normalization'):
+                self.attacker_population[self.attacker_population < 0] = 0
+                self.defender_population[self.defender_population < 0] = 0
+
+                self.attacker_population = self.attacker_population\
+                        /np.sum(self.attacker_population, axis=1,
+                               keepdims=True)
+                self.defender_population = self.defender_population\
+                        /np.sum(self.defender_population, axis=1,
+                               keepdims=True)
+
+        elif self.replicator == 'truncation':
+            with instrumentation.phase('update'):
+                self.truncate(self.attacker_population, payoffs_attacker)
+                self.truncate(self.defender_population, payoffs_defender)
+
+    def truncate(self, population, payoffs):
+        ''' Moves the population of the highest k fraction of the strategies
+        with non-zero population by expected payoff onto the lowest k
+        fraction in place, independently for every replicate, as done by
+        Population.truncate
+
+        Arguments:
+
+        population: numpy array of size <number of replicates> x <number of
+                    strategies> giving the population distributions
+        payoffs: numpy array of the same size giving the expected payoffs
+        '''
+        empty = population == 0
+        # Rank every row by payoff with the empty strategies placed last.
+        # Tied payoffs are ranked by strategy index, as the sort is stable
+        ranked = np.lexsort((tie_ranks(payoffs), empty), axis=-1)
+        support = population.shape[1] - np.sum(empty, axis=1)
+        n_moved = np.minimum((self.k*support).astype(int), support//2)
+        steps = np.arange(0, np.max(n_moved, initial=0))
+        moved = steps < n_moved[:, np.newaxis]
+        lowest = np.take_along_axis(ranked, steps[np.newaxis, :]\
+                *moved, axis=1)
+        highest = np.take_along_axis(ranked, (support[:, np.newaxis]-1-steps)\
+                *moved, axis=1)
+        transfer = np.take_along_axis(population, highest, axis=1)*moved
+        rows = np.arange(population.shape[0])[:, np.newaxis]
+        np.add.at(population, (rows, lowest), transfer)
+        population[np.nonzero(moved)[0], highest[moved]] = 0.0
+
+    def expected_payoffs_attacker(self, index=None):
+        ''' Returns the expected payoffs of the attacker strategies with the
+        given indices, or of every attacker strategy if index is None, as a
+        numpy array of size <number of replicates> x <number of strategies>
+        '''
+        n_strategies = self.attacker_strategies.shape[0] if index is None \
+                else len(index)
+        expected_payoffs = np.zeros((self.replicates, n_strategies),
+                self.dtype)
+        self.count_evaluations(expected_payoffs.size,
+                self.defender_strategies.shape[0])
+        if self.payoff == 'matrix':
+            for rows, payoffs in self.game.map_blocks(
+                    lambda rows, block: np.dot(self.defender_population,
+                                               block.T),
+                    self.attacker_payoff_matrix, index):
+                expected_payoffs[:, rows] = payoffs
+            return expected_payoffs
+        weights, constant = self.game.attacker_payoff_weights(
+                self.get_defence_profiles())
+        weights = weights.astype(self.dtype)
+        for rows, payoffs in self.game.map_blocks(
+                lambda rows, block: np.dot(weights, block.T)
+                        + constant[:, np.newaxis],
+                self.attacker_strategies, index, self.dtype):
+            expected_payoffs[:, rows] = payoffs
+        return expected_payoffs
+
+    def expected_payoffs_defender(self, index=None):
+        ''' Returns the expected payoffs of the defender strategies with the
+        given indices, or of every defender strategy if index is None, as a
+        numpy array of size <number of replicates> x <number of strategies>
+        '''
+        n_strategies = self.defender_strategies.shape[0] if index is None \
+                else len(index)
+        expected_payoffs = np.zeros((self.replicates, n_strategies),
+                self.dtype)
+        self.count_evaluations(expected_payoffs.size,
+                self.attacker_strategies.shape[0])
+        if self.payoff == 'matrix':
+            for rows, partial in self.game.map_blocks(
+                    lambda rows, block: np.dot(
+                            self.attacker_population[:, rows],
+                            block if index is None else block[:, index]),
+                    self.defender_payoff_matrix):
+                expected_payoffs += partial
+            return expected_payoffs
+        weights, constant = self.game.defender_payoff_weights(
+                self.get_attack_profiles())
+        weights = weights.astype(self.dtype)
+        for rows, payoffs in self.game.map_blocks(
+                lambda rows, block: np.dot(weights, block.T)
+                        + constant[:, np.newaxis],
+                self.defender_strategies, index, self.dtype):
+            expected_payoffs[:, rows] = payoffs
+        return expected_payoffs
+
+    def average_payoff_attacker(self):
+        ''' Calculates the average payoff of an attacker in every replicate
+        given the current attacker and defender populations '''
+        return np.sum(self.expected_payoffs_attacker()\
+                *self.attacker_population, axis=1)
+
+    def average_payoff_defender(self):
+        ''' Calculates the average payoff of a defender in every replicate
+        given the current attacker and defender populations '''
+        return np.sum(self.expected_payoffs_defender()\
+                *self.defender_population, axis=1)
+
+    def get_attack_profiles(self):
+        ''' Returns the attack profiles of every replicate as a numpy array of
+        size <number of replicates> x <number of nodes in tree> '''
+        profiles = np.zeros((self.replicates, self.game.N), self.dtype)
+        for rows, partial in self.game.map_blocks(
+                lambda rows, block: np.dot(self.attacker_population[:, rows],
+                                           block),
+                self.attacker_strategies, dtype=self.dtype):
+            profiles += partial
+        return profiles
+
+    def get_defence_profiles(self):
+        ''' Returns the defence profiles of every replicate as a numpy array of
+        size <number of replicates> x <number of nodes in tree> '''
+        profiles = np.zeros((self.replicates, self.game.N), self.dtype)
+        for rows, partial in self.game.map_blocks(
+                lambda rows, block: np.dot(self.defender_population[:, rows],
+                                           block),
+                self.defender_strategies, dtype=self.dtype):
+            profiles += partial
+        return profiles
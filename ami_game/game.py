@@ -1,32 +1,153 @@
+import collections
+import hashlib
+import logging
 import numpy as np
-import itertools
-
-def multichoose(n,k):
-    ''' Returns all possible permitations of n number which sum is below or
-    equal to k '''
-    if k < 0 or n < 0: return "Error"
-    if not k: return [[0]*n]
-    if not n: return []
-    if n == 1: return [[k]]
-    return [[0]+val for val in multichoose(n-1,k)] + \
-        [[val[0]+1]+val[1:] for val in multichoose(n,k-1)]
+import os
+import shutil
+import tempfile
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from math import comb
+from ami_game.symmetry import isomorphism_classes, node_orbits, \
+        orbit_strategies
+
+logger = logging.getLogger(__name__)
+
+# Default number of strategies per block for memory storage. The blocks do
+# not depend on the number of workers, so neither do the results
+BLOCK_SIZE = 8192
+# Largest number of utilities formed at a time by the batched utility
+# functions, e.g. attacker_utility_matrix
+TILE_SIZE = 2**20
+
+def number_of_strategies(n, k):
+    ''' Returns the number of ways to distribute k units over n numbers,
+    i.e. the number of rows returned by multichoose(n, k) '''
+    if k < 0 or n < 0:
+        raise ValueError('n and k must be non-negative')
+    if not n:
+        return 0 if k else 1
+    return comb(n+k-1, k)
+
+def multichoose(n, k, dtype=np.int64):
+    ''' Returns all possible permutations of n numbers which sum is equal
+    to k, as an integer numpy array of dimensions <number of permutations> x
+    <n> in lexicographic order
+
+    The array is allocated once and filled column by column: the values of
+    column j repeat once for every completion of the prefix they belong to,
+    so each column is a single np.repeat of the prefixes of length j+1.
+    '''
+    rows = number_of_strategies(n, k)
+    strategies = np.empty((rows, n), dtype=dtype)
+    if not n:
+        return strategies
+    # Sums of all prefixes of the current length, in lexicographic order
+    sums = np.zeros(1, dtype=np.int64)
+    for j in range(0, n-1):
+        counts = k - sums + 1
+        starts = np.cumsum(counts) - counts
+        values = np.arange(starts[-1] + counts[-1]) - np.repeat(starts, counts)
+        sums = np.repeat(sums, counts) + values
+        completions = np.array([number_of_strategies(n-j-1, u)
+                                for u in range(0, k+1)], dtype=np.int64)
+        strategies[:, j] = np.repeat(values, completions[k-sums])
+    strategies[:, n-1] = k - sums
+    return strategies
+
+def multichoose_chunks(n, k, chunk_size=65536, dtype=np.int64):
+    ''' Generator yielding the rows of multichoose(n, k) in the same order,
+    as integer numpy arrays of at most chunk_size rows
+
+    The leading columns are fixed to a prefix short enough that the
+    remaining columns of every prefix fit in one chunk. The completions only
+    depend on the prefix sum, so they are enumerated once per sum.
+    '''
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be positive')
+    if number_of_strategies(n, k) <= chunk_size:
+        yield multichoose(n, k, dtype)
+        return
+    depth = 1
+    while number_of_strategies(n-depth, k) > chunk_size:
+        depth += 1
+    prefixes = multichoose(depth+1, k, dtype)[:, :depth]
+    completions = {}
+    chunk = np.empty((chunk_size, n), dtype=dtype)
+    filled = 0
+    for prefix in prefixes:
+        remaining = k - int(prefix.sum())
+        if remaining not in completions:
+            completions[remaining] = multichoose(n-depth, remaining, dtype)
+        tail = completions[remaining]
+        if filled + tail.shape[0] > chunk_size:
+            yield chunk[:filled]
+            chunk = np.empty((chunk_size, n), dtype=dtype)
+            filled = 0
+        chunk[filled:filled+tail.shape[0], :depth] = prefix
+        chunk[filled:filled+tail.shape[0], depth:] = tail
+        filled += tail.shape[0]
+    yield chunk[:filled]
 
 class ConfidentialityGame():
     ''' Class for the confidentiality game '''
     attack_strategies = None
     defend_strategies = None
+    attack_multiplicities = None
+    defend_multiplicities = None
+    _executor = None
 
     def __init__(self, tree, K=5, a=0.3, attacker_budget=1.0,
-                        defender_budget=1.5):
+                        defender_budget=1.5, storage='memory',
+                        storage_dir=None, block_size=None, encoding='float',
+                        symmetry=False, workers=1, cache=None):
         ''' Constructor for the confidentiality game.
 
         Arguments:
 
-        tree: list of Nodes defining the tree structure of the game
+        tree: list of Nodes defining the tree structure of the game. The
+              tree is compiled into arrays here, so later changes to the
+              Nodes are not seen by the game
         K: resulution of the strategy space (integer > 1)
         a: the detection rate
         attacker_budget: the budget of the attacker population
         defender_budget: the budget of the defender population
+        storage: 'memory' keeps the strategy spaces in numpy arrays, 'memmap'
+                 writes them to memory-mapped files so that runs are bounded
+                 by disk rather than RAM
+        storage_dir: (only applies to memmap storage) directory for the
+                     memory-mapped files. A temporary directory that is
+                     removed with the game is used if not given
+        block_size: the number of strategies processed at a time, which
+                    bounds the peak memory of the utility and payoff
+                    computations and is the unit of work of the workers.
+                    Defaults to BLOCK_SIZE for memory storage and 65536 for
+                    memmap storage
+        encoding: 'float' stores the strategies as float64 allocations,
+                  'counts' stores the number of units on every node in the
+                  smallest unsigned integer type that holds the budget
+                  (uint8 up to 255 units), an eighth of the memory. Counts
+                  are scaled by 1/K block by block inside the computations,
+                  see decode
+        symmetry: if True, strategies that are permutations of each other
+                  over isomorphic sibling subtrees are merged into one
+                  strategy per orbit. Every row of the strategy spaces is
+                  then the mean strategy of an orbit, which gives the same
+                  utilities as a population spread evenly over the orbit,
+                  and attacker_multiplicities and defender_multiplicities
+                  give the number of strategies in every orbit. With the
+                  counts encoding, orbit representatives are stored and
+                  averaged over the orbit when decoded. Requires every node
+                  to have at most one parent
+        workers: the number of threads evaluating the blocks of strategies
+                 in the utility and payoff computations, see map_blocks.
+                 NumPy releases the GIL in its kernels, so the blocks run in
+                 parallel. Results are the same for any number of workers
+        cache: a StrategyCache that the strategy spaces are taken from
+               instead of enumerating them, e.g. default_cache() of
+               ami_game.cache. With the counts encoding, the cached arrays
+               are used as they are, read-only and shared between players
+               with the same budget. Symmetry reduced spaces are not cached
         '''
         self.K = K
         self.a = a
@@ -34,35 +155,333 @@ class ConfidentialityGame():
         self.defender_budget = defender_budget
         self.N = len(tree)
         self.tree = tree
-        print('Initializing game')
-        print('# \t v_i \t C_A \t C_D \t s^* \t t^*')
-        for ni, node in enumerate(self.tree):
-            value = node.value
-            s_star = node.cost_defence/value/(1-self.a)
-            t_star = 1.0-node.cost_attack/value/(1-self.a)
-            print('{0:3d} \t {1:0.2f} \t {2:0.2f} \t {3:0.2f} ' \
-                    '\t {4:0.2f} \t {5:0.2f}'.format(tree.index(node), value, 
-                            node.cost_attack,
-                        node.cost_defence, s_star, t_star))
+        self.compile_tree()
+        self.storage = storage
+        self.block_size = block_size
+        if self.storage == 'memmap':
+            if self.block_size is None:
+                self.block_size = 65536
+            if storage_dir is None:
+                storage_dir = tempfile.mkdtemp(prefix='ami_game_')
+                weakref.finalize(self, shutil.rmtree, storage_dir, True)
+            self.storage_dir = storage_dir
+        elif self.storage == 'memory':
+            if self.block_size is None:
+                self.block_size = BLOCK_SIZE
+        else:
+            raise ValueError('Unknown storage mode: '+str(storage))
+        if workers < 1:
+            raise ValueError('workers must be positive')
+        self.workers = workers
+        self.cache = cache
+        self.encoding = encoding
+        if self.encoding not in ('float', 'counts'):
+            raise ValueError('Unknown strategy encoding: '+str(encoding))
+        self.symmetry = symmetry
+        if self.symmetry:
+            if np.any(np.bincount(self.child_indices, minlength=self.N) > 1):
+                raise ValueError('Symmetry reduction requires every node to '
+                        'have at most one parent')
+            self.classes = isomorphism_classes(self)
+            self.node_orbits = node_orbits(self, self.classes)
+            # One-hot matrix of the node orbits and the orbit sizes, used to
+            # average allocations over the orbits
+            self.orbit_matrix = np.zeros((self.N, np.max(self.node_orbits)+1))
+            self.orbit_matrix[np.arange(self.N), self.node_orbits] = 1.0
+            self.orbit_sizes = np.sum(self.orbit_matrix, axis=0)
+        if logger.isEnabledFor(logging.INFO):
+            self.log_nodes()
+
+    def log_nodes(self):
+        ''' Logs the value, costs and indifference rates s^* and t^* of every
+        node at level INFO '''
+        logger.info('Initializing game')
+        logger.info('# \t v_i \t C_A \t C_D \t s^* \t t^*')
+        s_star = self.costs_defence/self.values/(1-self.a)
+        t_star = 1.0-self.costs_attack/self.values/(1-self.a)
+        for ni in range(0, self.N):
+            logger.info('{0:3d} \t {1:0.2f} \t {2:0.2f} \t {3:0.2f} ' \
+                    '\t {4:0.2f} \t {5:0.2f}'.format(ni, self.values[ni],
+                        self.costs_attack[ni], self.costs_defence[ni],
+                        s_star[ni], t_star[ni]))
+
+    def compile_tree(self):
+        ''' Compiles the Node objects of the tree into index arrays: the
+        node values and costs, the parent of every node (-1 for roots) and
+        the children of node i as child_indices[child_offsets[i]:
+        child_offsets[i+1]] '''
+        index = dict((id(node), ni) for ni, node in enumerate(self.tree))
+        self.values = np.array([node.value for node in self.tree], dtype=float)
+        self.costs_attack = np.array([node.cost_attack for node in self.tree],
+                dtype=float)
+        self.costs_defence = np.array([node.cost_defence
+                                       for node in self.tree], dtype=float)
+        children = []
+        for node in self.tree:
+            for childnode in node.children:
+                if id(childnode) not in index:
+                    raise ValueError('Child node missing from the tree list')
+                children.append(index[id(childnode)])
+        self.child_indices = np.array(children, dtype=np.intp)
+        self.child_offsets = np.zeros(self.N+1, dtype=np.intp)
+        self.child_offsets[1:] = np.cumsum([len(node.children)
+                                            for node in self.tree])
+        # Parent of every entry of child_indices
+        self.child_parents = np.repeat(np.arange(self.N),
+                np.diff(self.child_offsets))
+        self.parent = -np.ones(self.N, dtype=np.intp)
+        self.parent[self.child_indices[::-1]] = self.child_parents[::-1]
+
+    def fingerprint(self):
+        ''' Returns a hash of the game definition, i.e. the parameters of the
+        game and the compiled tree, as a hexadecimal string '''
+        digest = hashlib.sha256(repr((self.K, self.a, self.attacker_budget,
+                self.defender_budget, self.N)).encode('ascii'))
+        for array in (self.values, self.costs_attack, self.costs_defence):
+            digest.update(np.asarray(array, dtype='<f8').tobytes())
+        for array in (self.child_offsets, self.child_indices):
+            digest.update(np.asarray(array, dtype='<i8').tobytes())
+        if self.symmetry:
+            digest.update(b'symmetry')
+        return digest.hexdigest()
+
+    def children_sum(self, x):
+        ''' Returns x plus, for every node, the sum of x over its children.
+        x is a numpy array over the nodes along its last axis '''
+        x = np.asarray(x, dtype=float)
+        total = x.copy()
+        np.add.at(total.T, self.child_parents, x.T[self.child_indices])
+        return total
+
+    def parents_sum(self, x):
+        ''' Returns x plus, for every node, the sum of x over its parents.
+        x is a numpy array over the nodes along its last axis '''
+        x = np.asarray(x, dtype=float)
+        total = x.copy()
+        np.add.at(total.T, self.child_indices, x.T[self.child_parents])
+        return total
 
     def attacker_strategies(self):
         ''' Returns all possible attacker strategies as a numpy array of
-        dimensions <number of strategies> x <number of nodes in tree> '''
+        dimensions <number of strategies> x <number of nodes in tree>, holding
+        unit counts if the encoding of the game is 'counts' '''
         if self.attack_strategies is None:
-            budget = int(self.K*self.attacker_budget)
-            self.attack_strategies = np.asarray(
-                    multichoose(self.N, budget))/float(self.K)
+            self.attack_strategies, self.attack_multiplicities = \
+                    self.enumerate_strategies(
+                            int(self.K*self.attacker_budget),
+                            'attack_strategies')
         return self.attack_strategies
 
     def defender_strategies(self):
         ''' Returns all possible defender strategies as a numpy array of
-        dimensions <number of strategies> x <number of nodes in tree> '''
+        dimensions <number of strategies> x <number of nodes in tree>, holding
+        unit counts if the encoding of the game is 'counts' '''
         if self.defend_strategies is None:
-            budget = int(self.K*self.defender_budget)
-            self.defend_strategies = np.asarray(
-                        multichoose(self.N, budget))/float(self.K)
+            self.defend_strategies, self.defend_multiplicities = \
+                    self.enumerate_strategies(
+                            int(self.K*self.defender_budget),
+                            'defend_strategies')
         return self.defend_strategies
 
+    def attacker_multiplicities(self):
+        ''' Returns the number of attacker strategies that every row of
+        attacker_strategies stands for, all ones unless the game is
+        symmetry reduced '''
+        strategies = self.attacker_strategies()
+        if self.attack_multiplicities is None:
+            self.attack_multiplicities = np.ones(strategies.shape[0],
+                                                 dtype=np.int64)
+        return self.attack_multiplicities
+
+    def defender_multiplicities(self):
+        ''' Returns the number of defender strategies that every row of
+        defender_strategies stands for, all ones unless the game is
+        symmetry reduced '''
+        strategies = self.defender_strategies()
+        if self.defend_multiplicities is None:
+            self.defend_multiplicities = np.ones(strategies.shape[0],
+                                                 dtype=np.int64)
+        return self.defend_multiplicities
+
+    def symmetrize(self, x):
+        ''' Returns x averaged over the orbits of the nodes, i.e. over all
+        automorphisms of the tree. x is a numpy array over the nodes along
+        its last axis '''
+        return (np.dot(x, self.orbit_matrix)/self.orbit_sizes)\
+                [..., self.node_orbits]
+
+    def enumerate_strategies(self, budget, name):
+        ''' Returns all strategies distributing budget units of size 1/K
+        over the nodes, stored according to the storage mode of the game
+
+        Arguments:
+
+        budget: the number of units to distribute
+        name: name used for the memory-mapped file
+
+        Returns:
+
+        strategies: the strategy space
+        multiplicities: the number of strategies in the orbit of every row
+                        if the game is symmetry reduced, None otherwise
+        '''
+        dtype = np.min_scalar_type(budget)
+        if self.symmetry:
+            counts, multiplicities = orbit_strategies(self, budget,
+                                                      self.classes)
+            counts = counts.astype(dtype)
+            strategies = self.allocate(name, counts.shape,
+                    dtype if self.encoding == 'counts' else np.float64)
+            if self.encoding == 'counts':
+                strategies[:] = counts
+            else:
+                for rows in self.block_rows(counts):
+                    strategies[rows] = self.decode_counts(counts[rows])
+            return strategies, multiplicities
+        if self.cache is not None:
+            counts = self.cache.strategies(self.N, budget)
+            if self.encoding == 'counts':
+                return counts, None
+            if self.storage == 'memory':
+                return counts/float(self.K), None
+            chunks = (counts[rows] for rows in self.block_rows(counts))
+        elif self.storage == 'memory':
+            if self.encoding == 'counts':
+                return multichoose(self.N, budget, dtype), None
+            return multichoose(self.N, budget, dtype)/float(self.K), None
+        else:
+            chunks = multichoose_chunks(self.N, budget, self.block_size,
+                                        dtype)
+        strategies = self.allocate(name,
+                (number_of_strategies(self.N, budget), self.N),
+                dtype if self.encoding == 'counts' else np.float64)
+        start = 0
+        for chunk in chunks:
+            strategies[start:start+chunk.shape[0]] = \
+                    self.decode_counts(chunk) if self.encoding == 'float' \
+                    else chunk
+            start += chunk.shape[0]
+        strategies.flush()
+        return strategies, None
+
+    def allocate(self, name, shape, dtype=np.float64):
+        ''' Returns a zero-initialized array of the given shape and type, held
+        in memory or in a new memory-mapped file in the storage directory
+        depending on the storage mode of the game '''
+        if self.storage == 'memory':
+            return np.zeros(shape, dtype=dtype)
+        fd, filename = tempfile.mkstemp(prefix=name+'_', suffix='.npy',
+                dir=self.storage_dir)
+        os.close(fd)
+        return np.lib.format.open_memmap(filename, mode='w+',
+                dtype=dtype, shape=shape)
+
+    def decode(self, strategies, dtype=None):
+        ''' Returns strategies as float allocations. If the encoding of the
+        game is 'counts', integer arrays are unit counts and decoded with
+        decode_counts. Otherwise strategies are allocations whatever their
+        type, and only converted to float
+
+        Arguments:
+
+        strategies: numpy array of strategies, or of any float data such as
+                    payoffs
+        dtype: the float type to return, float64 for integer arrays if not
+               given. Float arrays are converted if a different type is
+               given
+        '''
+        strategies = np.asarray(strategies)
+        if strategies.dtype.kind in 'ui':
+            if self.encoding == 'counts':
+                return self.decode_counts(strategies, dtype)
+            return strategies.astype(np.float64 if dtype is None else dtype)
+        if dtype is None or strategies.dtype == dtype:
+            return strategies
+        return strategies.astype(dtype)
+
+    def decode_counts(self, counts, dtype=None):
+        ''' Returns integer unit counts as float allocations, i.e. divided by
+        K and averaged over their orbit if the game is symmetry reduced,
+        whatever the encoding of the game
+
+        Arguments:
+
+        counts: integer numpy array of unit counts
+        dtype: the float type to return, float64 if not given
+        '''
+        strategies = np.true_divide(counts, self.K,
+                dtype=np.float64 if dtype is None else dtype)
+        if self.symmetry:
+            strategies = self.symmetrize(strategies).astype(
+                    strategies.dtype, copy=False)
+        return strategies
+
+    def strategy_blocks(self, strategies, index=None, dtype=None):
+        ''' Generator splitting an array of strategies, or the rows of it
+        given by index, into consecutive blocks of at most block_size rows.
+        Yields (rows, block) pairs where rows is the slice of the block in
+        strategies, or in index if given. Blocks are decoded to float
+        allocations of the given type, see decode '''
+        for rows in self.block_rows(strategies, index):
+            yield rows, self.block(strategies, rows, index, dtype)
+
+    def block_rows(self, strategies, index=None):
+        ''' Returns the slices of the consecutive blocks of at most
+        block_size rows of strategies, or of index if given '''
+        n_strategies = strategies.shape[0] if index is None else len(index)
+        size = self.block_size or n_strategies or 1
+        return [slice(start, min(start+size, n_strategies))
+                for start in range(0, n_strategies, size)]
+
+    def block(self, strategies, rows, index=None, dtype=None):
+        ''' Returns the block of strategies given by the slice rows of
+        strategies, or of index if given, decoded to float allocations of
+        the given type '''
+        if index is None:
+            return self.decode(strategies[rows], dtype)
+        return self.decode(strategies[index[rows]], dtype)
+
+    def map_blocks(self, function, strategies, index=None, dtype=None):
+        ''' Generator applying function to the blocks of strategies of
+        strategy_blocks. Yields (rows, function(rows, block)) pairs in block
+        order. With more than one worker, the blocks are fetched, decoded and
+        evaluated on a thread pool, at most two blocks per worker ahead of
+        the consumer. The blocks only depend on block_size, so results
+        written to the rows or summed in the order yielded are the same for
+        any number of workers
+
+        Arguments:
+
+        function: function of the rows and the block of decoded strategies
+                  yielded by strategy_blocks, called from the worker threads
+        strategies, index, dtype: see strategy_blocks
+        '''
+        evaluate = lambda rows: function(rows, self.block(strategies, rows,
+                                                          index, dtype))
+        if self.workers == 1:
+            for rows in self.block_rows(strategies, index):
+                yield rows, evaluate(rows)
+            return
+        executor = self.executor()
+        pending = collections.deque()
+        for rows in self.block_rows(strategies, index):
+            pending.append((rows, executor.submit(evaluate, rows)))
+            if len(pending) >= 2*self.workers:
+                rows, future = pending.popleft()
+                yield rows, future.result()
+        while pending:
+            rows, future = pending.popleft()
+            yield rows, future.result()
+
+    def executor(self):
+        ''' Returns the thread pool of the game, created on first use and
+        shut down with the game '''
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix='ami_game')
+            weakref.finalize(self, self._executor.shutdown, False)
+        return self._executor
+
     def attacker_utility(self, attack_strategy, defence_strategies):
         ''' Returns the utility of a given attack strategy for each of a list
         of given defence strategies
@@ -80,20 +499,25 @@ class ConfidentialityGame():
                  strategies>
 
         '''
+        attack_strategy = self.decode(attack_strategy)
         utility = np.zeros(defence_strategies.shape[0])
-        for ni, node in enumerate(self.tree):
-            children_utility = np.zeros(defence_strategies.shape[0])
-            for childnode in node.children:
-                children_utility += childnode.value\
-                        *attack_strategy[ni]\
-                        *(1-self.a)*(1-defence_strategies[:,
-                            self.tree.index(childnode)])
-            utility += node.value*attack_strategy[ni]*(1-self.a)\
-                    *(1.0-defence_strategies[:, ni]) \
-                    - attack_strategy[ni]*node.cost_attack \
-                    + children_utility
+        for rows, block_utility in self.map_blocks(
+                lambda rows, block: self._attacker_utility_block(
+                        attack_strategy, block),
+                defence_strategies):
+            utility[rows] = block_utility
         return utility
 
+    def _attacker_utility_block(self, attack_strategy, defence_strategies):
+        ''' Returns the attacker utility for one block of defence strategies
+        '''
+        # Attacking a node also exposes its children, so the value of node j
+        # is gained by attacking j or any of its parents
+        exposure = self.values*self.parents_sum(attack_strategy)
+        return (1-self.a)*(np.sum(exposure) \
+                - np.dot(defence_strategies, exposure)) \
+                - np.dot(attack_strategy, self.costs_attack)
+
     def defender_utility(self, attack_strategies, defence_strategy):
         ''' Returns the utility of a given defence strategy for each of a list
         of given attack strategies
@@ -111,16 +535,189 @@ class ConfidentialityGame():
                  strategies>
 
         '''
+        defence_strategy = self.decode(defence_strategy)
         utility = np.zeros(attack_strategies.shape[0])
-        for ni, node in enumerate(self.tree):
-            children_utility = np.zeros(attack_strategies.shape[0])
-            for childnode in node.children:
-                children_utility += childnode.value\
-                        *attack_strategies[:, ni]\
-                        *(1-self.a)*(1-defence_strategy[
-                            self.tree.index(childnode)])
-            utility += - node.value*attack_strategies[:, ni]*(1-self.a)\
-                    *(1.0-defence_strategy[ni]) \
-                    - defence_strategy[ni]*node.cost_defence \
-                    - children_utility
+        for rows, block_utility in self.map_blocks(
+                lambda rows, block: self._defender_utility_block(block,
+                        defence_strategy),
+                attack_strategies):
+            utility[rows] = block_utility
         return utility
+
+    def _defender_utility_block(self, attack_strategies, defence_strategy):
+        ''' Returns the defender utility for one block of attack strategies
+        '''
+        # Value lost by attacking node i: its own undefended value and that
+        # of its children
+        exposure = self.children_sum(self.values*(1.0-defence_strategy))
+        return -(1-self.a)*np.dot(attack_strategies, exposure) \
+                - np.dot(defence_strategy, self.costs_defence)
+
+    def attacker_utility_matrix(self, attack_strategies, defence_strategies,
+                                weights=None, out=None, attack_index=None,
+                                defence_index=None):
+        ''' Returns the attacker utility of every pair of an attack strategy
+        and a defence strategy, or the expected utilities of the attack
+        strategies against the defence strategies weighted by weights. The
+        attack strategies are processed in blocks, see map_blocks, against
+        tiles of defence strategies, so no Python loop runs over single
+        strategies and at most TILE_SIZE utilities are formed at a time.
+        Strategies given by an index are read block by block and tile by
+        tile, so memory-mapped strategy spaces are never copied into memory
+
+        Arguments:
+
+        attack_strategies: numpy array of size <number of attack strategies>
+                           x <number of nodes in tree>
+        defence_strategies: numpy array of size <number of defence
+                            strategies> x <number of nodes in tree>
+        weights: optional numpy array of size <number of defence strategies>,
+                 e.g. a defender population distribution
+        out: optional array of size <number of attack strategies> x <number
+             of defence strategies> to write the utilities to, e.g. a
+             memory-mapped payoff matrix. Not used if weights are given
+        attack_index: optional numpy array of the indices of the rows of
+                      attack_strategies to use, which then stand for the
+                      attack strategies in the sizes above
+        defence_index: as attack_index, for defence_strategies
+
+        Returns:
+
+        utility: numpy array of size <number of attack strategies> x <number
+                 of defence strategies>, or of size <number of attack
+                 strategies> holding np.dot(utility, weights) if weights are
+                 given
+        '''
+        def tile(block, opponents):
+            exposure = self.values*self.parents_sum(block)
+            return (1-self.a)*(np.sum(exposure, axis=1)[:, np.newaxis] \
+                    - np.dot(exposure, opponents.T)) \
+                    - np.dot(block, self.costs_attack)[:, np.newaxis]
+        return self._utility_tiles(tile, attack_strategies,
+                defence_strategies, weights, out, False, attack_index,
+                defence_index)
+
+    def defender_utility_matrix(self, attack_strategies, defence_strategies,
+                                weights=None, out=None, attack_index=None,
+                                defence_index=None):
+        ''' Returns the defender utility of every pair of an attack strategy
+        and a defence strategy, or the expected utilities of the defence
+        strategies against the attack strategies weighted by weights, see
+        attacker_utility_matrix
+
+        Arguments:
+
+        attack_strategies: numpy array of size <number of attack strategies>
+                           x <number of nodes in tree>
+        defence_strategies: numpy array of size <number of defence
+                            strategies> x <number of nodes in tree>
+        weights: optional numpy array of size <number of attack strategies>,
+                 e.g. an attacker population distribution
+        out: optional array of size <number of attack strategies> x <number
+             of defence strategies> to write the utilities to. Not used if
+             weights are given
+        attack_index, defence_index: optional numpy arrays of the indices of
+                                     the rows of the strategies to use, see
+                                     attacker_utility_matrix
+
+        Returns:
+
+        utility: numpy array of size <number of attack strategies> x <number
+                 of defence strategies>, or of size <number of defence
+                 strategies> holding np.dot(weights, utility) if weights are
+                 given
+        '''
+        def tile(block, opponents):
+            exposure = self.children_sum(self.values*(1.0-block))
+            return -(1-self.a)*np.dot(exposure, opponents.T) \
+                    - np.dot(block, self.costs_defence)[:, np.newaxis]
+        return self._utility_tiles(tile, defence_strategies,
+                attack_strategies, weights, out, True, defence_index,
+                attack_index)
+
+    def _utility_tiles(self, tile, strategies, opponents, weights, out,
+                       transposed, index=None, opponent_index=None):
+        ''' Evaluates the utilities of strategies against opponents given by
+        tile(block, opponents) for blocks of strategies and tiles of
+        opponents, and writes them to out or reduces them with the weights
+        over the opponents. If transposed, out is indexed by opponents first.
+        Only the rows given by index and opponent_index are used if given
+        '''
+        n = strategies.shape[0] if index is None else len(index)
+        m = opponents.shape[0] if opponent_index is None \
+                else len(opponent_index)
+        if weights is None and out is None:
+            out = np.zeros((m, n) if transposed else (n, m))
+
+        def evaluate(rows, block):
+            size = max(1, TILE_SIZE//max(block.shape[0], 1))
+            reduced = None if weights is None else np.zeros(block.shape[0])
+            for start in range(0, m, size):
+                columns = slice(start, min(start+size, m))
+                utility = tile(block, self.block(opponents, columns,
+                                                 opponent_index))
+                if weights is not None:
+                    reduced += np.dot(utility, weights[columns])
+                elif transposed:
+                    out[columns, rows] = utility.T
+                else:
+                    out[rows, columns] = utility
+            return reduced
+
+        if weights is None:
+            for _ in self.map_blocks(evaluate, strategies, index):
+                pass
+            return out
+        utility = np.zeros(n)
+        for rows, reduced in self.map_blocks(evaluate, strategies, index):
+            utility[rows] = reduced
+        return utility
+
+    def attacker_payoff_weights(self, defence_profile):
+        ''' Returns the per-node weights and the constant of the attacker
+        utility against a given defence profile. The utility is linear in the
+        attack strategy and affine in the defence strategy, so the expected
+        utility of an attack strategy s against a defender population with
+        profile defence_profile is np.dot(s, weights) + constant
+
+        Arguments:
+
+        defence_profile: numpy array of size <number of nodes in tree> giving
+                         the average defence strategy of a population, or
+                         an array of such profiles stacked along the first
+                         axis
+
+        Returns:
+
+        weights: numpy array of the same size as defence_profile
+        constant: float, or numpy array of one constant per profile
+        '''
+        defence_profile = np.asarray(defence_profile)
+        weights = (1-self.a)*self.children_sum(
+                self.values*(1.0-defence_profile)) - self.costs_attack
+        if defence_profile.ndim == 1:
+            return weights, 0.0
+        return weights, np.zeros(defence_profile.shape[:-1])
+
+    def defender_payoff_weights(self, attack_profile):
+        ''' Returns the per-node weights and the constant of the defender
+        utility against a given attack profile, such that the expected
+        utility of a defence strategy t against an attacker population with
+        profile attack_profile is np.dot(t, weights) + constant
+
+        Arguments:
+
+        attack_profile: numpy array of size <number of nodes in tree> giving
+                        the average attack strategy of a population, or an
+                        array of such profiles stacked along the first axis
+
+        Returns:
+
+        weights: numpy array of the same size as attack_profile
+        constant: float, or numpy array of one constant per profile
+        '''
+        # Attack rate each node is exposed to, directly or through its parent
+        exposure = self.parents_sum(attack_profile)
+        weights = (1-self.a)*self.values*exposure - self.costs_defence
+        constant = -(1-self.a)*np.dot(exposure, self.values)
+        return weights, constant
@@ -0,0 +1,103 @@
+import json
+import time
+
+class Phase(object):
+    ''' Context manager adding the wall time of a block to a phase of an
+    Instrumentation object '''
+
+    __slots__ = ('seconds', 'name', 'start')
+
+    def __init__(self, seconds, name):
+        self.seconds = seconds
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds[self.name] = self.seconds.get(self.name, 0.0) \
+                + time.perf_counter() - self.start
+
+class NullPhase(object):
+    ''' Context manager that does nothing, used when instrumentation is
+    disabled '''
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+NULL_PHASE = NullPhase()
+
+class Instrumentation(object):
+    ''' Class accumulating the wall time spent in named phases of a run and
+    counts of the work done, e.g. utility evaluations and strategy rows
+    touched. One object can be shared by several populations to aggregate
+    over a sweep '''
+
+    enabled = True
+
+    def __init__(self):
+        ''' Constructor for the Instrumentation class '''
+        self.reset()
+
+    def reset(self):
+        ''' Clears all timings and counters '''
+        self.seconds = {}
+        self.counts = {}
+
+    def phase(self, name):
+        ''' Returns a context manager that adds the wall time of the block it
+        encloses to the given phase
+
+        Arguments:
+
+        name: name of the phase, e.g. 'payoffs' or 'normalization'
+        '''
+        return Phase(self.seconds, name)
+
+    def count(self, name, n=1):
+        ''' Adds n to the given counter '''
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def snapshot(self):
+        ''' Returns a copy of the timings and counters as a dictionary with
+        the keys 'seconds' and 'counts' '''
+        return {'seconds': dict(self.seconds), 'counts': dict(self.counts)}
+
+    def to_json(self, **kwargs):
+        ''' Returns the snapshot as a JSON string. Keyword arguments are
+        passed on to json.dumps '''
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def report(self):
+        ''' Returns a human-readable table of the phases, sorted by time,
+        followed by the counters '''
+        total = sum(self.seconds.values())
+        lines = ['{0:<20}{1:>12}{2:>8}'.format('Phase', 'Seconds', '%')]
+        for name, seconds in sorted(self.seconds.items(),
+                                    key=lambda item: -item[1]):
+            lines.append('{0:<20}{1:>12.4f}{2:>8.1f}'.format(name, seconds,
+                    100.0*seconds/total if total > 0 else 0.0))
+        for name, n in sorted(self.counts.items()):
+            lines.append('{0:<20}{1:>12d}'.format(name, n))
+        return '\n'.join(lines)
+
+class NullInstrumentation(Instrumentation):
+    ''' Instrumentation that records nothing. Populations use it when
+    instrumentation is disabled, so the instrumented code paths only cost a
+    method call '''
+
+    enabled = False
+
+    def phase(self, name):
+        return NULL_PHASE
+
+    def count(self, name, n=1):
+        pass
+
+NULL_INSTRUMENTATION = NullInstrumentation()
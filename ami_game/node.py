@@ -1,5 +1,6 @@
 class Node(object):
     '''Class for a node in an tree.'''
+    __slots__ = ('value', 'cost_attack', 'cost_defence', 'children')
 
     def __init__(self, children=None, cost_attack=1.0,
             cost_defence=1.0, value=3.0):
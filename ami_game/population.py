@@ -1,11 +1,50 @@
+import logging
 import numpy as np
-import sys
+from ami_game.instrumentation import Instrumentation, NULL_INSTRUMENTATION
+
+logger = logging.getLogger(__name__)
+
+# Relative difference to the largest payoff below which the truncation
+# replicator treats payoffs as tied, to absorb the rounding error of the
+# order of summation
+TIE_TOLERANCE = 1e-9
+
+def restrict(population, support):
+    ''' Returns the entries of a population distribution in the given
+    support, or the full distribution if support is None '''
+    if support is None:
+        return population
+    return population[support]
+
+def tie_ranks(payoffs):
+    ''' Returns the rank of every payoff among the distinct payoffs along the
+    last axis, counting payoffs that follow each other in sorted order within
+    TIE_TOLERANCE of the largest payoff as equal '''
+    payoffs = np.asarray(payoffs)
+    order = np.argsort(payoffs, axis=-1, kind='stable')
+    ordered = np.take_along_axis(payoffs, order, axis=-1)
+    scale = np.max(np.abs(payoffs), axis=-1, keepdims=True, initial=0.0)
+    distinct = np.diff(ordered, axis=-1) > TIE_TOLERANCE*scale
+    ranks = np.empty(payoffs.shape, dtype=np.intp)
+    np.put_along_axis(ranks, order, np.concatenate([np.zeros(
+            payoffs.shape[:-1]+(1,), dtype=np.intp), np.cumsum(distinct,
+            axis=-1)], axis=-1), axis=-1)
+    return ranks
+
+def read_only(array):
+    ''' Returns a read-only view of a numpy array '''
+    view = np.asarray(array).view()
+    view.flags.writeable = False
+    return view
 
 class Population:
     ''' Class for a population of attackers and defender in a given game '''
 
     def __init__(self, game, attacker_distribution, defender_distribution,
-                    replicator='REQN', k=0.2, dt=0.1, delta = 0.1):
+                    replicator='REQN', k=0.2, dt=0.1, delta = 0.1,
+                    payoff='direct', integrator='euler', tolerance=1e-4,
+                    instrument=False, incremental=False, refresh_interval=50,
+                    dtype=np.float64):
         ''' Constructor for the Population class
 
         Arguments:
@@ -19,109 +58,467 @@ class Population:
                                population distribution 
         replicator: the type of replicator dynamic to use. 
         k: (only applies to truncation replicator) the fraction of the
-           population to truncate
+           population to truncate, at most one half
         dt: (only applies to the REQN replicator) the time step between 
-            generations in the 
+            generations, or the initial time step for adaptive integrators
         delta: (only applies to the REQN replicator) parameter scaling the 
-               random noise introduced between each generation
+               random noise introduced between each generation. Under the
+               rk23 integrator the noise is scaled by the step taken
+               relative to dt, so that it is the same per unit time
+        payoff: how expected payoffs are evaluated. 'direct' evaluates the
+                utility of every strategy pair each generation, 'matrix'
+                builds the attacker and defender payoff matrices once and
+                reduces every generation to matrix-vector products, and
+                'profile' uses that the utilities are bilinear to evaluate
+                all strategies against the opponent profile without ever
+                forming a payoff matrix
+        integrator: (only applies to the REQN replicator) 'euler' takes a
+                    fixed explicit Euler step of length dt every generation,
+                    'rk23' takes one adaptive Bogacki-Shampine step whose
+                    length is controlled by the local error
+        tolerance: (only applies to the rk23 integrator) the maximum local
+                   error of any population entry in one step
+        instrument: True to accumulate the wall time of every phase of the
+                    run and counts of utility evaluations and strategy rows
+                    in the attribute instrumentation, or an Instrumentation
+                    object to accumulate into, e.g. one shared by several
+                    populations. Disabled by default at negligible cost
+        incremental: (only applies to the truncation replicator) if True,
+                     the expected payoffs of the support are kept between
+                     generations and only updated with the contribution of
+                     the opponent strategies whose population changed, so a
+                     generation costs in proportion to the number of moved
+                     strategies instead of the size of the supports
+        refresh_interval: (only applies to incremental payoffs) the number of
+                          generations between full recomputations of the
+                          expected payoffs, which bound the accumulation of
+                          round-off errors
+        dtype: the float type of the population distributions, payoffs and
+               profiles. np.float32 halves the memory and bandwidth of
+               payoff matrices and strategy blocks at the cost of precision
 
         '''
         self.game = game
+        if isinstance(instrument, Instrumentation):
+            self.instrumentation = instrument
+        elif instrument:
+            self.instrumentation = Instrumentation()
+        else:
+            self.instrumentation = NULL_INSTRUMENTATION
         self.replicator = replicator
         self.k = k
         self.dt = dt
-        self.attacker_population = attacker_distribution
-        self.defender_population = defender_distribution
-        self.delta = delta/attacker_distribution.shape[0]
-        self.attacker_strategies = game.attacker_strategies()
-        self.defender_strategies = game.defender_strategies()
+        # Step the noise amplitude refers to, as dt adapts under rk23
+        self.noise_step = dt
+        self.integrator = integrator
+        self.tolerance = tolerance
+        if self.integrator not in ('euler', 'rk23'):
+            raise ValueError('Unknown integrator: '+str(integrator))
+        self.incremental = incremental
+        self.refresh_interval = refresh_interval
+        if self.incremental and self.replicator != 'truncation':
+            raise ValueError('Incremental payoffs require the truncation '
+                    'replicator')
+        # Expected payoffs of every strategy against the current opponent
+        # population, valid on the supports and maintained between
+        # generations by incremental payoffs. None forces a full evaluation
+        self.attacker_payoffs = None
+        self.defender_payoffs = None
+        # Number of generations replicated and time integrated by the REQN
+        # replicator
+        self.generation = 0
+        self.time = 0.0
+        self.dtype = np.dtype(dtype)
+        self.attacker_population = np.asarray(attacker_distribution,
+                dtype=self.dtype)
+        self.defender_population = np.asarray(defender_distribution,
+                dtype=self.dtype)
+        with self.instrumentation.phase('enumeration'):
+            self.attacker_strategies = game.attacker_strategies()
+            self.defender_strategies = game.defender_strategies()
+        # Number of strategies every entry stands for in a symmetry reduced
+        # game, which scales the noise of the REQN replicator
+        self.attacker_multiplicities = game.attacker_multiplicities()
+        self.defender_multiplicities = game.defender_multiplicities()
+        self.delta = delta/np.sum(self.attacker_multiplicities)
+        self.payoff = payoff
+        if self.payoff == 'matrix':
+            with self.instrumentation.phase('payoff_matrices'):
+                self.attacker_payoff_matrix, self.defender_payoff_matrix = \
+                        self.payoff_matrices()
+        elif self.payoff not in ('direct', 'profile'):
+            raise ValueError('Unknown payoff mode: '+str(payoff))
+        # Indices of the strategies with non-zero population, maintained by
+        # the truncation replicator as the support only shrinks. None means
+        # that every strategy is considered.
+        self.attacker_support = None
+        self.defender_support = None
+        if self.replicator == 'truncation':
+            self.attacker_support = np.flatnonzero(self.attacker_population)
+            self.defender_support = np.flatnonzero(self.defender_population)
+
+    def payoff_matrices(self):
+        ''' Returns the attacker and defender payoff matrices, i.e. two numpy
+        arrays of size <number of attacker strategies> x <number of defender
+        strategies> holding the utility of every strategy pair '''
+        N_A = self.attacker_strategies.shape[0]
+        N_D = self.defender_strategies.shape[0]
+        attacker_matrix = self.game.allocate('attacker_payoffs', (N_A, N_D),
+                self.dtype)
+        defender_matrix = self.game.allocate('defender_payoffs', (N_A, N_D),
+                self.dtype)
+        self.game.attacker_utility_matrix(self.attacker_strategies,
+                self.defender_strategies, out=attacker_matrix)
+        self.game.defender_utility_matrix(self.attacker_strategies,
+                self.defender_strategies, out=defender_matrix)
+        self.instrumentation.count('utility_evaluations', 2*N_A*N_D)
+        self.instrumentation.count('strategy_rows', N_A+N_D+2*N_A*N_D)
+        return attacker_matrix, defender_matrix
 
     def calculate_utilities(self):
-        ''' Calculates average utilities for both attackers and defenders '''
-        self.average_utility_attacker = self.average_payoff_attacker()
-        self.average_utility_defender = self.average_payoff_defender()
+        ''' Calculates average utilities for both attackers and defenders.
+        Returns the expected payoffs of the attacker and defender strategies
+        in the supports that the averages were computed from '''
+        with self.instrumentation.phase('payoffs'):
+            if self.incremental and self.attacker_payoffs is not None:
+                payoffs_attacker = restrict(self.attacker_payoffs,
+                        self.attacker_support)
+                payoffs_defender = restrict(self.defender_payoffs,
+                        self.defender_support)
+            else:
+                payoffs_attacker = self.expected_payoffs_attacker(
+                        self.attacker_support)
+                payoffs_defender = self.expected_payoffs_defender(
+                        self.defender_support)
+                if self.incremental:
+                    self.attacker_payoffs = np.zeros(
+                            self.attacker_strategies.shape[0], self.dtype)
+                    self.defender_payoffs = np.zeros(
+                            self.defender_strategies.shape[0], self.dtype)
+                    self.attacker_payoffs[self.attacker_support] = \
+                            payoffs_attacker
+                    self.defender_payoffs[self.defender_support] = \
+                            payoffs_defender
+        with self.instrumentation.phase('averaging'):
+            self.average_utility_attacker = np.inner(payoffs_attacker,
+                    restrict(self.attacker_population, self.attacker_support))
+            self.average_utility_defender = np.inner(payoffs_defender,
+                    restrict(self.defender_population, self.defender_support))
+        return payoffs_attacker, payoffs_defender
 
     def replicate(self):
         ''' Updates the attacker and defender populations using a method 
         given in the class variable replicator '''
-        self.calculate_utilities()
+        instrumentation = self.instrumentation
+        self.generation += 1
+        instrumentation.count('generations')
+        payoffs_attacker, payoffs_defender = self.calculate_utilities()
         if self.replicator == 'REQN':
-            # Calculate attacker population change
-            dp_s = np.zeros(len(self.attacker_population))
-            for si, attacker in enumerate(self.attacker_population):
-                dp_s[si] = attacker*(self.expected_payoff_attacker(\
-                        self.attacker_strategies[si, :]) \
+            with instrumentation.phase('update'):
+                # Calculate attacker population change
+                dp_s = self.attacker_population*(payoffs_attacker \
                         - self.average_utility_attacker)
 
-            # Calculate defender population change
-            dp_t = np.zeros(len(self.defender_population))
-            for ti, defender in enumerate(self.defender_population):
-                dp_t[ti] = defender*(self.expected_payoff_defender(\
-                        self.defender_strategies[ti, :]) \
+                # Calculate defender population change
+                dp_t = self.defender_population*(payoffs_defender \
                         - self.average_utility_defender)
 
-            # Update population
-            self.attacker_population = self.attacker_population + self.dt*dp_s
-            self.defender_population = self.defender_population + self.dt*dp_t
+                # Update population
+                if self.integrator == 'euler':
+                    self.attacker_population = self.attacker_population \
+                            + self.dt*dp_s
+                    self.defender_population = self.defender_population \
+                            + self.dt*dp_t
+                    self.time += self.dt
+                    delta = self.delta
+                else:
+                    self.attacker_population, self.defender_population, \
+                            step = self.adaptive_step(dp_s, dp_t)
+                    delta = self.delta*step/self.noise_step
 
             # Add random fluctuation
-            N_A = self.attacker_population.shape[0]
-            N_D = self.defender_population.shape[0]
-            self.attacker_population += self.delta*np.random.rand(N_A)/N_A
-            self.defender_population += self.delta*np.random.rand(N_D)/N_D
+            with instrumentation.phase('noise'):
+                N_A = self.attacker_population.shape[0]
+                N_D = self.defender_population.shape[0]
+                self.attacker_population += delta\
+                        *np.random.rand(N_A)*self.attacker_multiplicities\
+                        /np.sum(self.attacker_multiplicities)
+                self.defender_population += delta\
+                        *np.random.rand(N_D)*self.defender_multiplicities\
+                        /np.sum(self.defender_multiplicities)
+
+            with instrumentation.phase('normalization'):
+                # Remove any negative populations
+                self.attacker_population[self.attacker_population < 0] = 0
+                self.defender_population[self.defender_population < 0] = 0
+
+                # Normalization step
+                self.attacker_population = self.attacker_population\
+                        /np.sum(self.attacker_population)
+                self.defender_population = self.defender_population\
+                        /np.sum(self.defender_population)
 
-            # Remove any negative populations
-            self.attacker_population[self.attacker_population < 0] = 0
-            self.defender_population[self.defender_population < 0] = 0
+        elif self.replicator == 'truncation':
+            with instrumentation.phase('update'):
+                attacker_support = self.attacker_support
+                defender_support = self.defender_support
+                attackers = self.attacker_population[attacker_support]
+                defenders = self.defender_population[defender_support]
+                self.attacker_support = self.truncate(
+                        self.attacker_population, attacker_support,
+                        payoffs_attacker)
+                self.defender_support = self.truncate(
+                        self.defender_population, defender_support,
+                        payoffs_defender)
+
+            if self.incremental:
+                with instrumentation.phase('incremental'):
+                    if self.generation % self.refresh_interval == 0:
+                        self.attacker_payoffs = None
+                        self.defender_payoffs = None
+                    else:
+                        self.update_payoffs(attacker_support, attackers,
+                                defender_support, defenders)
+
+    def run(self, generations, observers=(), stride=1, log_interval=None):
+        ''' Replicates the populations for a number of generations and passes
+        the population to the observers every stride generations. Profiles
+        and utilities are only computed by observers that need them, so a
+        large stride keeps the bookkeeping of a long run cheap
+
+        Arguments:
 
-            # Normalization step
-            self.attacker_population = self.attacker_population\
-                    /np.sum(self.attacker_population)
-            self.defender_population = self.defender_population\
-                    /np.sum(self.defender_population)
+        generations: the maximum number of generations to replicate
+        observers: callables taking the population, e.g. a
+                   TrajectoryRecorder or ConvergenceMonitor. The run stops
+                   after the first sample where an observer returns True
+        stride: the number of generations between samples, counted by the
+                generation attribute so that resumed runs sample the same
+                generations
+        log_interval: the number of generations between progress messages
+                      logged at level INFO, none if not given
 
-        elif self.replicator == 'truncation':
-            
-            # Extract subset of strategies with non-zero population
-            attackers_nonzero = np.nonzero(self.attacker_population)[0]
-            s_nonzero = list([self.attacker_strategies[i, :] for i in 
-                    attackers_nonzero])
-            defenders_nonzero = np.nonzero(self.defender_population)[0]
-            t_nonzero = list([self.defender_strategies[i, :] for i in
-                    defenders_nonzero])
-            attacker_population_nonzero = \
-                    self.attacker_population[attackers_nonzero]
-            defender_population_nonzero = \
-                    self.defender_population[defenders_nonzero]
-
-            # Calculate utilities for every strategy (of non-zero population)
-            utilities_attacker = np.zeros(len(s_nonzero))
-            utilities_defender = np.zeros(len(t_nonzero))
-            for si, s in enumerate(s_nonzero):
-                utilities_attacker[si] = self.expected_payoff_attacker(s)
-
-            for ti, t in enumerate(t_nonzero):
-                utilities_defender[ti] = self.expected_payoff_defender(t)
-
-            # Sort by utility
-            sorted_attackers = np.argsort(utilities_attacker)
-            sorted_defenders = np.argsort(utilities_defender)
-
-            # Move population for lowest k percent to highest k percent
-            for ik in range(0, int(self.k*sorted_attackers.size)):
-                attacker_population_nonzero[sorted_attackers[ik]] += \
-                        attacker_population_nonzero[sorted_attackers[-ik-1]]
-                attacker_population_nonzero[sorted_attackers[-ik-1]] = 0.0
-            for ik in range(0, int(self.k*sorted_defenders.size)):
-                defender_population_nonzero[sorted_defenders[ik]] += \
-                        defender_population_nonzero[sorted_defenders[-ik-1]]
-                defender_population_nonzero[sorted_defenders[-ik-1]] = 0.0
-
-            # Update full population
-            self.attacker_population[attackers_nonzero] = \
-                                    attacker_population_nonzero
-            self.defender_population[defenders_nonzero] = \
-                                    defender_population_nonzero
+        Returns:
+
+        generations: the number of generations replicated
+        '''
+        for i, snapshot in enumerate(self.evolve(generations)):
+            if log_interval and self.generation % log_interval == 0:
+                logger.info('Generation %d', self.generation)
+            if self.generation % stride == 0:
+                # Every observer sees the sample before the run stops
+                stop = [observer(self) for observer in observers]
+                if any(stop):
+                    logger.info('Stopped by an observer at generation %d',
+                                self.generation)
+                    return i+1
+        return generations
+
+    def evolve(self, generations=None, stride=1):
+        ''' Generator replicating the populations and yielding a Snapshot
+        every stride generations. A generation is only replicated when the
+        next snapshot is requested, so consumers set the pace of the run and
+        can stop it at any point by no longer iterating
+
+        Arguments:
+
+        generations: the maximum number of generations to replicate, no
+                     limit if None
+        stride: the number of generations between snapshots, counted by the
+                generation attribute
+
+        Example:
+
+            for snapshot in population.evolve(10000, stride=10):
+                recorder.record(snapshot)
+                if monitor.update(snapshot):
+                    break
+        '''
+        count = 0
+        while generations is None or count < generations:
+            self.replicate()
+            count += 1
+            if self.generation % stride == 0:
+                yield Snapshot(self)
+
+    def update_payoffs(self, attacker_support, attackers, defender_support,
+                       defenders):
+        ''' Updates the stored expected payoffs of the current supports with
+        the change of the opponent populations since they were evaluated
+
+        Arguments:
+
+        attacker_support, defender_support: the supports the populations
+                                            were restricted to before the
+                                            change
+        attackers, defenders: the populations in these supports before the
+                              change
+        '''
+        changed = self.attacker_population[attacker_support] != attackers
+        changed_attackers = attacker_support[changed]
+        delta_attackers = self.attacker_population[changed_attackers] \
+                - attackers[changed]
+        changed = self.defender_population[defender_support] != defenders
+        changed_defenders = defender_support[changed]
+        delta_defenders = self.defender_population[changed_defenders] \
+                - defenders[changed]
+        self.attacker_payoffs[self.attacker_support] += \
+                self.payoff_changes_attacker(self.attacker_support,
+                        changed_defenders, delta_defenders)
+        self.defender_payoffs[self.defender_support] += \
+                self.payoff_changes_defender(self.defender_support,
+                        changed_attackers, delta_attackers)
+
+    def payoff_changes_attacker(self, index, changed, delta):
+        ''' Returns the change of the expected payoffs of the attacker
+        strategies with the given indices when the populations of the
+        defender strategies with the indices changed change by delta '''
+        self.count_evaluations(len(index), len(changed))
+        changes = np.zeros(len(index), self.dtype)
+        if len(changed) == 0:
+            return changes
+        if self.payoff == 'matrix':
+            for rows, block_changes in self.game.map_blocks(
+                    lambda rows, block: np.dot(block[:, changed], delta),
+                    self.attacker_payoff_matrix, index):
+                changes[rows] = block_changes
+        elif self.payoff == 'profile':
+            # The payoffs are affine in the defence profile
+            weights, constant = self.game.attacker_payoff_weights(np.array(
+                    [np.dot(delta, self.game.decode(
+                        self.defender_strategies[changed], self.dtype)),
+                     np.zeros(self.game.N)]))
+            weights = (weights[0] - (1.0-np.sum(delta))*weights[1])\
+                    .astype(self.dtype)
+            constant = constant[0] - (1.0-np.sum(delta))*constant[1]
+            for rows, block_changes in self.game.map_blocks(
+                    lambda rows, block: np.dot(block, weights) + constant,
+                    self.attacker_strategies, index, self.dtype):
+                changes[rows] = block_changes
+        else:
+            changes[:] = self.game.attacker_utility_matrix(
+                    self.attacker_strategies, self.defender_strategies,
+                    weights=delta, attack_index=index, defence_index=changed)
+        return changes
+
+    def payoff_changes_defender(self, index, changed, delta):
+        ''' Returns the change of the expected payoffs of the defender
+        strategies with the given indices when the populations of the
+        attacker strategies with the indices changed change by delta '''
+        self.count_evaluations(len(index), len(changed))
+        changes = np.zeros(len(index), self.dtype)
+        if len(changed) == 0:
+            return changes
+        if self.payoff == 'matrix':
+            for rows, partial in self.game.map_blocks(
+                    lambda rows, block: np.dot(delta[rows], block[:, index]),
+                    self.defender_payoff_matrix, changed):
+                changes += partial
+        elif self.payoff == 'profile':
+            # The payoffs are affine in the attack profile
+            weights, constant = self.game.defender_payoff_weights(np.array(
+                    [np.dot(delta, self.game.decode(
+                        self.attacker_strategies[changed], self.dtype)),
+                     np.zeros(self.game.N)]))
+            weights = (weights[0] - (1.0-np.sum(delta))*weights[1])\
+                    .astype(self.dtype)
+            constant = constant[0] - (1.0-np.sum(delta))*constant[1]
+            for rows, block_changes in self.game.map_blocks(
+                    lambda rows, block: np.dot(block, weights) + constant,
+                    self.defender_strategies, index, self.dtype):
+                changes[rows] = block_changes
+        else:
+            changes[:] = self.game.defender_utility_matrix(
+                    self.attacker_strategies, self.defender_strategies,
+                    weights=delta, attack_index=changed, defence_index=index)
+        return changes
+
+    def replicator_rates(self, attacker_population, defender_population):
+        ''' Returns the time derivatives of the attacker and defender
+        populations under the replicator equation, evaluated at the given
+        populations instead of the current ones '''
+        current = (self.attacker_population, self.defender_population)
+        self.attacker_population = attacker_population
+        self.defender_population = defender_population
+        try:
+            payoffs_attacker = self.expected_payoffs_attacker()
+            payoffs_defender = self.expected_payoffs_defender()
+        finally:
+            self.attacker_population, self.defender_population = current
+        return attacker_population*(payoffs_attacker \
+                    - np.inner(payoffs_attacker, attacker_population)), \
+                defender_population*(payoffs_defender \
+                    - np.inner(payoffs_defender, defender_population))
+
+    def adaptive_step(self, rate_attacker, rate_defender):
+        ''' Advances the populations by one accepted Bogacki-Shampine step
+        of the replicator equation and adapts dt for the next step, so that
+        the local error stays below the tolerance
+
+        Arguments:
+
+        rate_attacker: time derivative of the current attacker population
+        rate_defender: time derivative of the current defender population
+
+        Returns:
+
+        attacker_population, defender_population: the advanced populations
+        step: the length of the accepted step
+        '''
+        p = self.attacker_population
+        q = self.defender_population
+        while True:
+            h = self.dt
+            k2 = self.replicator_rates(p + 0.5*h*rate_attacker,
+                                       q + 0.5*h*rate_defender)
+            k3 = self.replicator_rates(p + 0.75*h*k2[0], q + 0.75*h*k2[1])
+            p_new = p + h*(2.0/9*rate_attacker + 1.0/3*k2[0] + 4.0/9*k3[0])
+            q_new = q + h*(2.0/9*rate_defender + 1.0/3*k2[1] + 4.0/9*k3[1])
+            k4 = self.replicator_rates(p_new, q_new)
+            # Difference to the embedded second order solution
+            error = max(np.max(np.abs(h*(-5.0/72*rate_attacker
+                        + 1.0/12*k2[0] + 1.0/9*k3[0] - 1.0/8*k4[0]))),
+                        np.max(np.abs(h*(-5.0/72*rate_defender
+                        + 1.0/12*k2[1] + 1.0/9*k3[1] - 1.0/8*k4[1]))))
+            ratio = error/self.tolerance
+            factor = 5.0 if ratio == 0 else \
+                    min(5.0, max(0.2, 0.9*ratio**(-1.0/3)))
+            self.dt = h*factor
+            if ratio <= 1:
+                self.time += h
+                return p_new, q_new, h
+            if self.dt < 1e-12:
+                raise RuntimeError('Step size underflow in the integrator')
+
+    def truncate(self, population, support, payoffs):
+        ''' Moves the population of the highest k fraction of the support by
+        expected payoff onto the lowest k fraction in place, the i-th highest
+        strategy to the i-th lowest, and returns the remaining support, which
+        no longer holds the highest k fraction. This is the direction of the
+        original truncation replicator, which is kept on purpose
+
+        Arguments:
+
+        population: numpy array giving a population distribution
+        support: sorted numpy array of the indices of the strategies with
+                 non-zero population
+        payoffs: numpy array of the expected payoffs of the strategies in the
+                 support
+
+        Returns:
+
+        support: sorted numpy array of the indices that still have non-zero
+                 population
+        '''
+        # Tied payoffs are ranked by strategy index, so that the order does
+        # not depend on the order of summation
+        ranked = support[np.lexsort((support, tie_ranks(payoffs)))]
+        n_moved = min(int(self.k*ranked.size), ranked.size//2)
+        lowest = ranked[:n_moved]
+        highest = ranked[ranked.size-n_moved:][::-1]
+        population[lowest] += population[highest]
+        population[highest] = 0.0
+        return np.sort(ranked[:ranked.size-n_moved])
 
     def expected_payoff_attacker(self, attacker_strategy):
         ''' Calculates the expected payoff associated with a given attacker
@@ -159,37 +556,125 @@ class Population:
                     defender_strategy),self.attacker_population)
         return expected_payoff
     
+    def expected_payoffs_attacker(self, index=None):
+        ''' Returns the expected payoff of the attacker strategies with the
+        given indices, or of every attacker strategy if index is None, against
+        the current defender population as a numpy array '''
+        expected_payoffs = np.zeros(self.attacker_strategies.shape[0]
+                if index is None else len(index), self.dtype)
+        self.count_evaluations(expected_payoffs.size,
+                self.defender_strategies.shape[0] if self.defender_support
+                is None else self.defender_support.size)
+        if self.payoff == 'matrix':
+            for rows, payoffs in self.game.map_blocks(
+                    lambda rows, block: np.dot(block,
+                                               self.defender_population),
+                    self.attacker_payoff_matrix, index):
+                expected_payoffs[rows] = payoffs
+            return expected_payoffs
+        if self.payoff == 'profile':
+            weights, constant = self.game.attacker_payoff_weights(
+                    self.get_defence_profiles())
+            weights = weights.astype(self.dtype)
+            for rows, payoffs in self.game.map_blocks(
+                    lambda rows, block: np.dot(block, weights) + constant,
+                    self.attacker_strategies, index, self.dtype):
+                expected_payoffs[rows] = payoffs
+            return expected_payoffs
+        expected_payoffs[:] = self.game.attacker_utility_matrix(
+                self.attacker_strategies, self.defender_strategies,
+                weights=restrict(self.defender_population,
+                                 self.defender_support),
+                attack_index=index, defence_index=self.defender_support)
+        return expected_payoffs
+
+    def expected_payoffs_defender(self, index=None):
+        ''' Returns the expected payoff of the defender strategies with the
+        given indices, or of every defender strategy if index is None, against
+        the current attacker population as a numpy array '''
+        expected_payoffs = np.zeros(self.defender_strategies.shape[0]
+                if index is None else len(index), self.dtype)
+        self.count_evaluations(expected_payoffs.size,
+                self.attacker_strategies.shape[0] if self.attacker_support
+                is None else self.attacker_support.size)
+        if self.payoff == 'matrix':
+            attackers = restrict(self.attacker_population,
+                    self.attacker_support)
+            for rows, partial in self.game.map_blocks(
+                    lambda rows, block: np.dot(attackers[rows], block
+                            if index is None else block[:, index]),
+                    self.defender_payoff_matrix, self.attacker_support):
+                expected_payoffs += partial
+            return expected_payoffs
+        if self.payoff == 'profile':
+            weights, constant = self.game.defender_payoff_weights(
+                    self.get_attack_profiles())
+            weights = weights.astype(self.dtype)
+            for rows, payoffs in self.game.map_blocks(
+                    lambda rows, block: np.dot(block, weights) + constant,
+                    self.defender_strategies, index, self.dtype):
+                expected_payoffs[rows] = payoffs
+            return expected_payoffs
+        expected_payoffs[:] = self.game.defender_utility_matrix(
+                self.attacker_strategies, self.defender_strategies,
+                weights=restrict(self.attacker_population,
+                                 self.attacker_support),
+                attack_index=self.attacker_support, defence_index=index)
+        return expected_payoffs
+
+    def count_evaluations(self, strategies, opponents):
+        ''' Counts the work of evaluating the expected payoffs of a number of
+        strategies against a number of opponent strategies. Direct payoffs
+        evaluate the utility of every strategy pair, profile payoffs one
+        utility per strategy after reducing the opponents to a profile, and
+        matrix payoffs read one stored entry per pair instead '''
+        instrumentation = self.instrumentation
+        if not instrumentation.enabled:
+            return
+        if self.payoff == 'direct':
+            instrumentation.count('utility_evaluations', strategies*opponents)
+            instrumentation.count('strategy_rows', strategies*(1+opponents))
+        elif self.payoff == 'profile':
+            instrumentation.count('utility_evaluations', strategies)
+            instrumentation.count('strategy_rows', strategies+opponents)
+        else:
+            instrumentation.count('matrix_entries', strategies*opponents)
+
     def average_payoff_attacker(self):
         ''' Calculates the average payoff of an attacker given the current
         attacker and defender populations '''
-        average_payoff = 0.0
-        for ia in range(0, self.attacker_strategies.shape[0]):
-            average_payoff += self.expected_payoff_attacker( \
-                    self.attacker_strategies[ia, :]) \
-                    *self.attacker_population[ia]
-        return average_payoff
+        return np.inner(self.expected_payoffs_attacker(),
+                self.attacker_population)
 
     def average_payoff_defender(self):  
         ''' Calculates the average payoff of a defender given the current
         attacker and defender populations '''
-        average_payoff = 0.0
-        for di in range(0, self.defender_strategies.shape[0]):
-            average_payoff += self.expected_payoff_defender( \
-                    self.defender_strategies[di, :]) \
-                    *self.defender_population[di]
-        return average_payoff
+        return np.inner(self.expected_payoffs_defender(),
+                self.defender_population)
 
     def get_attack_profiles(self):
         ''' Returns the attack profiles given the current attacker and defender
         populations, i.e. a numpy array of size <number of nodes in tree>
         giving to what degree the different nodes are attacked '''
-        return np.dot(self.attacker_population, self.attacker_strategies)
+        attackers = restrict(self.attacker_population, self.attacker_support)
+        profile = np.zeros(self.game.N, self.dtype)
+        for rows, partial in self.game.map_blocks(
+                lambda rows, block: np.dot(attackers[rows], block),
+                self.attacker_strategies, self.attacker_support, self.dtype):
+            profile += partial
+        return profile
 
     def get_defence_profiles(self):
         ''' Returns the defence profiles given the current attacker and defender
         populations, i.e. a numpy array of size <number of nodes in tree>
         giving to what degree the different nodes are defended '''
-        return np.dot(self.defender_population, self.defender_strategies)
+        defenders = restrict(self.defender_population, self.defender_support)
+        profile = np.zeros(self.game.N, self.dtype)
+        for rows, partial in self.game.map_blocks(
+                lambda rows, block: np.dot(defenders[rows], block),
+                self.defender_strategies, self.defender_support, self.dtype):
+            profile += partial
+        return profile
 
     def get_average_attacker_utility(self):
         ''' Returns the average attacker utility that was last calculated '''
@@ -199,3 +684,70 @@ class Population:
         ''' Returns the average defender utility that was last calculated '''
         return self.average_utility_defender
 
+class Snapshot(object):
+    ''' Class for a lightweight view of the state of a Population after a
+    generation, as yielded by Population.evolve. The population
+    distributions are read-only views, not copies. Profiles and utilities
+    are computed on first use and memoized, and offer the getters of
+    Population, so a snapshot can be passed to a TrajectoryRecorder or
+    ConvergenceMonitor in place of the population.
+
+    A snapshot is valid until the population is replicated again: the
+    truncation replicator changes the distributions in place, and the
+    profiles can then no longer be computed '''
+
+    __slots__ = ('population', 'generation', 'time', 'attacker_population',
+                 'defender_population', 'average_utility_attacker',
+                 'average_utility_defender', '_attack_profiles',
+                 '_defence_profiles')
+
+    def __init__(self, population):
+        ''' Constructor for the Snapshot class
+
+        Arguments:
+
+        population: the Population object to take the snapshot of
+        '''
+        self.population = population
+        self.generation = population.generation
+        self.time = population.time
+        self.attacker_population = read_only(population.attacker_population)
+        self.defender_population = read_only(population.defender_population)
+        self.average_utility_attacker = population.average_utility_attacker
+        self.average_utility_defender = population.average_utility_defender
+        self._attack_profiles = None
+        self._defence_profiles = None
+
+    def check_current(self):
+        ''' Raises a RuntimeError if the population has been replicated since
+        the snapshot was taken '''
+        if self.population.generation != self.generation:
+            raise RuntimeError('The population has advanced from generation '
+                    +str(self.generation)+' to '
+                    +str(self.population.generation))
+
+    def get_attack_profiles(self):
+        ''' Returns the attack profiles of the snapshot, see
+        Population.get_attack_profiles '''
+        if self._attack_profiles is None:
+            self.check_current()
+            self._attack_profiles = read_only(
+                    self.population.get_attack_profiles())
+        return self._attack_profiles
+
+    def get_defence_profiles(self):
+        ''' Returns the defence profiles of the snapshot, see
+        Population.get_defence_profiles '''
+        if self._defence_profiles is None:
+            self.check_current()
+            self._defence_profiles = read_only(
+                    self.population.get_defence_profiles())
+        return self._defence_profiles
+
+    def get_average_attacker_utility(self):
+        ''' Returns the average attacker utility of the snapshot '''
+        return self.average_utility_attacker
+
+    def get_average_defender_utility(self):
+        ''' Returns the average defender utility of the snapshot '''
+        return self.average_utility_defender
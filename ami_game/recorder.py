@@ -0,0 +1,171 @@
+import numpy as np
+import os
+
+# Size of the .npy header written by AppendableArray. It is fixed so that the
+# header can be rewritten in place when rows are appended
+HEADER_SIZE = 128
+
+class AppendableArray(object):
+    ''' Class for a two-dimensional float array in a .npy file that rows are
+    appended to. The header is rewritten with the new shape on every flush,
+    so the file is a valid .npy file that can be memory-mapped at any time '''
+
+    def __init__(self, filename, columns, append=False, buffer_size=1024):
+        ''' Constructor for the AppendableArray class
+
+        Arguments:
+
+        filename: name of the .npy file
+        columns: the number of columns of the array
+        append: if True, rows are appended to an existing file instead of
+                overwriting it
+        buffer_size: the number of rows kept in memory between flushes
+        '''
+        self.filename = filename
+        self.columns = columns
+        self.rows = 0
+        if append and os.path.exists(filename):
+            existing = np.load(filename, mmap_mode='r')
+            if existing.ndim != 2 or existing.shape[1] != columns:
+                raise ValueError('Cannot append to '+filename+' with shape '
+                        +str(existing.shape))
+            self.rows = existing.shape[0]
+            with open(filename, 'rb') as f:
+                np.lib.format.read_magic(f)
+                np.lib.format.read_array_header_1_0(f)
+                offset = f.tell()
+            if offset != HEADER_SIZE:
+                # Not written by this class, rewrite it with a fixed header
+                data = np.array(existing, dtype=np.float64)
+                del existing
+                self.file = open(filename, 'wb')
+                self.write_header()
+                self.file.write(data.tobytes())
+            else:
+                del existing
+                self.file = open(filename, 'r+b')
+                self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(filename, 'wb')
+            self.write_header()
+        self.buffer = np.zeros((buffer_size, columns))
+        self.buffered = 0
+
+    def write_header(self):
+        ''' Writes the .npy header for the current number of rows at the
+        start of the file '''
+        header = "{'descr': '<f8', 'fortran_order': False, 'shape': (%d, %d), }" \
+                % (self.rows, self.columns)
+        header = header.ljust(HEADER_SIZE - 11) + '\n'
+        position = self.file.tell()
+        self.file.seek(0)
+        self.file.write(b'\x93NUMPY\x01\x00')
+        self.file.write(np.array(len(header), dtype='<u2').tobytes())
+        self.file.write(header.encode('latin1'))
+        if position > HEADER_SIZE:
+            self.file.seek(position)
+
+    def append(self, row):
+        ''' Appends a row to the array '''
+        self.buffer[self.buffered] = row
+        self.buffered += 1
+        if self.buffered == self.buffer.shape[0]:
+            self.flush()
+
+    def flush(self):
+        ''' Writes the buffered rows to the file and updates its header '''
+        if self.buffered:
+            self.file.write(self.buffer[:self.buffered].astype('<f8')
+                            .tobytes())
+            self.rows += self.buffered
+            self.buffered = 0
+            self.write_header()
+        self.file.flush()
+
+    def close(self):
+        ''' Flushes and closes the file '''
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+class TrajectoryRecorder(object):
+    ''' Class streaming the attack profiles, defence profiles and average
+    utilities of a run to the binary files attackers.npy, defenders.npy and
+    utility.npy. Rows are buffered and appended, so the cost of recording
+    does not grow with the length of the run '''
+
+    def __init__(self, directory, N, append=False, buffer_size=1024):
+        ''' Constructor for the TrajectoryRecorder class
+
+        Arguments:
+
+        directory: the directory to write the files to
+        N: the number of nodes in the tree
+        append: if True, a previous trajectory in the directory is continued
+        buffer_size: the number of generations kept in memory between
+                     flushes to disk
+        '''
+        self.attackers = AppendableArray(os.path.join(directory,
+                'attackers.npy'), N, append, buffer_size)
+        self.defenders = AppendableArray(os.path.join(directory,
+                'defenders.npy'), N, append, buffer_size)
+        self.utility = AppendableArray(os.path.join(directory,
+                'utility.npy'), 2, append, buffer_size)
+
+    def record(self, population):
+        ''' Records the current attack and defence profiles and the average
+        utilities of a population
+
+        Arguments:
+
+        population: a Population object, after calculate_utilities or
+                    replicate has been called
+        '''
+        self.attackers.append(population.get_attack_profiles())
+        self.defenders.append(population.get_defence_profiles())
+        self.utility.append([population.get_average_attacker_utility(),
+                             population.get_average_defender_utility()])
+
+    def __call__(self, population):
+        ''' Records a population, so that the recorder can be passed to
+        Population.run as an observer '''
+        self.record(population)
+
+    def generations(self):
+        ''' Returns the number of generations recorded '''
+        return self.utility.rows + self.utility.buffered
+
+    def flush(self):
+        ''' Writes all buffered generations to disk '''
+        self.attackers.flush()
+        self.defenders.flush()
+        self.utility.flush()
+
+    def close(self):
+        ''' Flushes and closes the files '''
+        self.attackers.close()
+        self.defenders.close()
+        self.utility.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def load_trajectory(directory, mmap_mode='r'):
+    ''' Returns the attack profiles, defence profiles and average utilities
+    written by a TrajectoryRecorder, memory-mapped by default
+
+    Arguments:
+
+    directory: the directory of the recorded run
+    mmap_mode: passed on to np.load, None reads the arrays into memory
+
+    Returns:
+
+    attack_profiles, defence_profiles, average_utility
+    '''
+    return tuple(np.load(os.path.join(directory, name+'.npy'),
+                         mmap_mode=mmap_mode)
+                 for name in ('attackers', 'defenders', 'utility'))
@@ -0,0 +1,231 @@
+import numpy as np
+from ami_game.game import ConfidentialityGame, multichoose
+from ami_game.population import Population
+
+def strategy_counts(game, strategies):
+    ''' Returns the unit counts of strategies of a game as an integer numpy
+    array, whatever the encoding of the game '''
+    strategies = np.asarray(strategies)
+    if strategies.dtype.kind in 'ui':
+        return strategies.astype(np.int64)
+    return np.rint(strategies*game.K).astype(np.int64)
+
+def unit_moves(counts):
+    ''' Returns every allocation that differs from one of the given unit
+    counts by moving a single unit from one node to another, together with
+    the row of counts it was moved from
+
+    Arguments:
+
+    counts: integer numpy array of size <number of strategies> x <number of
+            nodes in tree>
+
+    Returns:
+
+    moved: integer numpy array of the moved allocations
+    source: integer numpy array giving the row of counts of every moved
+            allocation
+    '''
+    N = counts.shape[1]
+    moved = []
+    source = []
+    for i in range(0, N):
+        rows = np.flatnonzero(counts[:, i] > 0)
+        base = counts[rows].copy()
+        base[:, i] -= 1
+        # Add the unit to every other node
+        targets = np.delete(np.arange(N), i)
+        allocations = np.repeat(base, targets.size, axis=0)
+        allocations[np.arange(allocations.shape[0]),
+                    np.tile(targets, rows.size)] += 1
+        moved.append(allocations)
+        source.append(np.repeat(rows, targets.size))
+    return np.vstack(moved), np.concatenate(source)
+
+def refine_strategies(counts, fine_units, radius=1):
+    ''' Returns the allocations of fine_units units that lie around the
+    given allocations at twice the resolution. Every allocation is doubled,
+    the units that the finer budget has in addition are spread over the
+    nodes in every possible way, and the results are extended by up to
+    radius single unit moves
+
+    Arguments:
+
+    counts: integer numpy array of size <number of strategies> x <number of
+            nodes in tree> giving the coarse unit counts
+    fine_units: the number of units of the fine strategies, at least twice
+                the coarse budget
+    radius: the number of unit moves away from the doubled allocations to
+            include
+
+    Returns:
+
+    fine: integer numpy array of the distinct fine allocations, in
+          lexicographic order
+    source, pairs: integer numpy arrays listing the pairs of a coarse
+                   allocation and a fine allocation around it, as rows of
+                   counts and of fine
+    distance: integer numpy array giving the number of unit moves between
+              the doubled coarse allocation and the fine allocation of
+              every pair
+    '''
+    n, N = counts.shape
+    remainder = fine_units - 2*int(np.sum(counts[0])) if n else 0
+    if remainder < 0:
+        raise ValueError('The fine budget is less than twice the coarse '
+                'budget')
+    extra = multichoose(N, remainder)
+    candidates = [np.repeat(2*counts, extra.shape[0], axis=0)
+                  + np.tile(extra, (n, 1))]
+    sources = [np.repeat(np.arange(n), extra.shape[0])]
+    distances = [np.zeros(n*extra.shape[0], dtype=np.int64)]
+    for d in range(1, radius+1):
+        moved, previous = unit_moves(candidates[-1])
+        candidates.append(moved)
+        sources.append(sources[-1][previous])
+        distances.append(np.full(moved.shape[0], d, dtype=np.int64))
+    candidates = np.vstack(candidates)
+    fine, pairs = np.unique(candidates, axis=0, return_inverse=True)
+    pairs = pairs.ravel()
+    source = np.concatenate(sources)
+    distance = np.concatenate(distances)
+    # Keep every (coarse, fine) pair once, at its smallest distance
+    order = np.lexsort((distance, pairs, source))
+    first = np.ones(order.size, dtype=bool)
+    first[1:] = (source[order][1:] != source[order][:-1]) \
+            | (pairs[order][1:] != pairs[order][:-1])
+    keep = order[first]
+    return fine, source[keep], pairs[keep], distance[keep]
+
+def project_distribution(distribution, source, pairs, distance, n_fine,
+                         spread=0.1):
+    ''' Returns the distribution over fine strategies obtained by moving the
+    population of every coarse strategy to its doubled allocations, except
+    for the fraction spread, which is shared evenly by the allocations that
+    are unit moves away. The result is normalized
+
+    Arguments:
+
+    distribution: numpy array giving the coarse population distribution
+    source, pairs, distance: as returned by refine_strategies
+    n_fine: the number of fine strategies
+    spread: the fraction of the population of a coarse strategy given to
+            its neighbours, if it has any
+    '''
+    near = distance == 0
+    counts_near = np.bincount(source[near], minlength=distribution.size)
+    counts_far = np.bincount(source[~near], minlength=distribution.size)
+    share_far = np.where(counts_far > 0, spread, 0.0)
+    weights = np.where(near, (1.0-share_far[source])
+                       /np.maximum(counts_near[source], 1),
+                       share_far[source]/np.maximum(counts_far[source], 1))
+    fine = np.bincount(pairs, weights=weights*distribution[source],
+                       minlength=n_fine)
+    return fine/np.sum(fine)
+
+def refine_population(population, mass=0.99, radius=1, spread=0.1):
+    ''' Returns a Population at twice the resolution of the game of a given
+    population. Only the strategies carrying the largest populations, up to
+    the given total mass, are refined, so the fine strategy space is never
+    enumerated in full. The population distributions are projected onto the
+    fine strategies and the replicator settings are carried over
+
+    Arguments:
+
+    population: a Population object. Symmetry reduced games are not
+                supported
+    mass: the fraction of the population of each player whose strategies
+          are refined. The strategies with the largest populations are
+          refined first, the rest is dropped
+    radius: the number of unit moves around the doubled strategies that are
+            included in the fine strategy space
+    spread: the fraction of the population of every refined strategy that
+            is given to its neighbours
+
+    Returns:
+
+    population: a Population object for a ConfidentialityGame with
+                resolution 2K over the refined strategy spaces
+    '''
+    game = population.game
+    if game.symmetry:
+        raise ValueError('Refinement of symmetry reduced games is not '
+                'supported')
+    fine_game = ConfidentialityGame(game.tree, K=2*game.K, a=game.a,
+            attacker_budget=game.attacker_budget,
+            defender_budget=game.defender_budget, storage=game.storage,
+            block_size=game.block_size, encoding=game.encoding,
+            workers=game.workers)
+    distributions = []
+    for distribution, strategies, budget, name in \
+            [(population.attacker_population, population.attacker_strategies,
+              game.attacker_budget, 'attack_strategies'),
+             (population.defender_population, population.defender_strategies,
+              game.defender_budget, 'defend_strategies')]:
+        # Refine the smallest set of strategies holding the given mass
+        order = np.argsort(distribution)[::-1]
+        kept = np.sort(order[:np.searchsorted(np.cumsum(
+                distribution[order]), mass*np.sum(distribution))+1])
+        fine, source, pairs, distance = refine_strategies(
+                strategy_counts(game, strategies[kept]),
+                int(fine_game.K*budget), radius)
+        distributions.append(project_distribution(
+                distribution[kept].astype(np.float64), source, pairs,
+                distance, fine.shape[0], spread))
+        stored = fine_game.allocate(name, fine.shape,
+                np.min_scalar_type(int(fine_game.K*budget))
+                if fine_game.encoding == 'counts' else np.float64)
+        stored[:] = fine if fine_game.encoding == 'counts' \
+                else fine/float(fine_game.K)
+        setattr(fine_game, name, stored)
+    refined = Population(fine_game, distributions[0], distributions[1],
+            replicator=population.replicator, k=population.k,
+            dt=population.dt, payoff=population.payoff,
+            integrator=population.integrator, tolerance=population.tolerance,
+            instrument=population.instrumentation
+            if population.instrumentation.enabled else False,
+            incremental=population.incremental,
+            refresh_interval=population.refresh_interval,
+            dtype=population.dtype)
+    # The noise keeps its amplitude, instead of being rescaled to the size
+    # of the restricted fine strategy space, and its amplitude per unit time
+    # when dt has adapted
+    refined.delta = population.delta
+    refined.noise_step = population.noise_step
+    return refined
+
+def run_multiresolution(game, generations, levels=2, mass=0.99, radius=1,
+                        spread=0.1, **population_arguments):
+    ''' Runs the population dynamics from uniform populations at the
+    resolution of the game, then refines the populations to twice the
+    resolution around the strategies that carry population and continues,
+    levels times in total
+
+    Arguments:
+
+    game: the ConfidentialityGame to start from, at a coarse resolution K
+    generations: the number of generations to run at every resolution, or a
+                 list of one number per level
+    levels: the number of resolutions, the last one being K*2**(levels-1)
+    mass, radius, spread: see refine_population
+    population_arguments: keyword arguments passed on to Population
+
+    Returns:
+
+    populations: list of the Population object at the end of every level
+    '''
+    if np.isscalar(generations):
+        generations = [generations]*levels
+    S = game.attacker_strategies().shape[0]
+    T = game.defender_strategies().shape[0]
+    population = Population(game, np.ones(S)/S, np.ones(T)/T,
+                            **population_arguments)
+    populations = []
+    for level in range(0, levels):
+        if level > 0:
+            population = refine_population(population, mass, radius,
+                                           spread)
+        for i in range(0, generations[level]):
+            population.replicate()
+        populations.append(population)
+    return populations
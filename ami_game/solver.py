@@ -0,0 +1,154 @@
+import numpy as np
+from scipy.optimize import linprog
+
+def best_response(weights, units):
+    ''' Returns the allocation of a number of units over the nodes that
+    maximizes np.dot(allocation, weights). The utilities are linear in the
+    own strategy and the units are not capped per node, so every unit goes
+    to the node with the largest weight
+
+    Arguments:
+
+    weights: numpy array of size <number of nodes in tree> giving the
+             payoff of one unit on every node
+    units: the number of units to distribute
+
+    Returns:
+
+    allocation: integer numpy array of size <number of nodes in tree>
+    '''
+    allocation = np.zeros(len(weights), dtype=np.int64)
+    allocation[np.argmax(weights)] = units
+    return allocation
+
+def solve_zero_sum(payoffs):
+    ''' Returns the optimal mixed strategies of the row and column player of
+    a zero-sum game where the row player receives payoffs[i, j] '''
+    m, n = payoffs.shape
+    # Row player: maximize v such that every column pays at least v
+    row = linprog(np.r_[np.zeros(m), -1.0],
+            A_ub=np.c_[-payoffs.T, np.ones(n)], b_ub=np.zeros(n),
+            A_eq=np.r_[np.ones(m), 0.0][np.newaxis], b_eq=[1.0],
+            bounds=[(0, None)]*m + [(None, None)], method='highs')
+    # Column player: minimize w such that no row pays more than w
+    column = linprog(np.r_[np.zeros(n), 1.0],
+            A_ub=np.c_[payoffs, -np.ones(m)], b_ub=np.zeros(m),
+            A_eq=np.r_[np.ones(n), 0.0][np.newaxis], b_eq=[1.0],
+            bounds=[(0, None)]*n + [(None, None)], method='highs')
+    if not (row.success and column.success):
+        raise RuntimeError('Could not solve the restricted game')
+    return normalize(row.x[:m]), normalize(column.x[:n])
+
+def normalize(distribution):
+    ''' Returns a distribution with round-off negatives removed that sums
+    to one '''
+    distribution = np.maximum(distribution, 0.0)
+    return distribution/np.sum(distribution)
+
+class DoubleOracle(object):
+    ''' Class computing an equilibrium of a ConfidentialityGame with the
+    double-oracle method, without enumerating the strategy spaces.
+
+    The attacker and defender utilities add up to -s.C_A - t.C_D, where each
+    term only depends on one player. The game is therefore strategically
+    equivalent to the zero-sum game where the attacker receives
+    u_A(s, t) + t.C_D, and every restricted game is solved as a linear
+    program. '''
+
+    def __init__(self, game, tolerance=1e-9, max_iterations=1000):
+        ''' Constructor for the DoubleOracle class
+
+        Arguments:
+
+        game: a ConfidentialityGame object. Only its parameters and tree are
+              used, its strategy spaces are never enumerated
+        tolerance: the largest payoff improvement of a best response over
+                   the restricted equilibrium that is accepted as converged
+        max_iterations: the maximum number of restricted games to solve
+        '''
+        self.game = game
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.attacker_units = int(game.K*game.attacker_budget)
+        self.defender_units = int(game.K*game.defender_budget)
+
+    def solve(self):
+        ''' Runs the double-oracle loop. Returns True if no best response
+        improves on the restricted equilibrium by more than the tolerance
+        within max_iterations, False otherwise. The restricted strategies and
+        the equilibrium distributions over them are kept in the attributes
+        attacker_strategies, defender_strategies, attacker_population and
+        defender_population '''
+        game = self.game
+        K = float(game.K)
+        # Start from the best responses to an undefended tree
+        s = best_response(game.attacker_payoff_weights(np.zeros(game.N))[0],
+                self.attacker_units)
+        t = best_response(game.defender_payoff_weights(s/K)[0],
+                self.defender_units)
+        attack_units = [s]
+        defence_units = [t]
+        self.converged = False
+        for self.iterations in range(1, self.max_iterations+1):
+            self.attacker_strategies = np.array(attack_units)/K
+            self.defender_strategies = np.array(defence_units)/K
+            payoffs = game.attacker_utility_matrix(self.attacker_strategies,
+                                                   self.defender_strategies)
+            payoffs += np.dot(self.defender_strategies, game.costs_defence)
+            self.attacker_population, self.defender_population = \
+                    solve_zero_sum(payoffs)
+
+            # Best responses against the restricted equilibrium
+            attack_profile = self.get_attack_profiles()
+            defence_profile = self.get_defence_profiles()
+            attacker_weights, _ = game.attacker_payoff_weights(defence_profile)
+            defender_weights, _ = game.defender_payoff_weights(attack_profile)
+            s = best_response(attacker_weights, self.attacker_units)
+            t = best_response(defender_weights, self.defender_units)
+            self.attacker_gain = np.dot(s/K - attack_profile,
+                                        attacker_weights)
+            self.defender_gain = np.dot(t/K - defence_profile,
+                                        defender_weights)
+            if self.attacker_gain <= self.tolerance \
+                    and self.defender_gain <= self.tolerance:
+                self.converged = True
+                break
+            added = False
+            if self.attacker_gain > self.tolerance and \
+                    not any(np.array_equal(s, known) for known in attack_units):
+                attack_units.append(s)
+                added = True
+            if self.defender_gain > self.tolerance and \
+                    not any(np.array_equal(t, known)
+                            for known in defence_units):
+                defence_units.append(t)
+                added = True
+            if not added:
+                break
+        return self.converged
+
+    def get_attack_profiles(self):
+        ''' Returns the attack profile of the restricted equilibrium, i.e. a
+        numpy array of size <number of nodes in tree> giving to what degree
+        the different nodes are attacked '''
+        return np.dot(self.attacker_population, self.attacker_strategies)
+
+    def get_defence_profiles(self):
+        ''' Returns the defence profile of the restricted equilibrium, i.e. a
+        numpy array of size <number of nodes in tree> giving to what degree
+        the different nodes are defended '''
+        return np.dot(self.defender_population, self.defender_strategies)
+
+    def get_average_attacker_utility(self):
+        ''' Returns the average attacker utility of the restricted
+        equilibrium '''
+        weights, constant = self.game.attacker_payoff_weights(
+                self.get_defence_profiles())
+        return np.dot(self.get_attack_profiles(), weights) + constant
+
+    def get_average_defender_utility(self):
+        ''' Returns the average defender utility of the restricted
+        equilibrium '''
+        weights, constant = self.game.defender_payoff_weights(
+                self.get_attack_profiles())
+        return np.dot(self.get_defence_profiles(), weights) + constant
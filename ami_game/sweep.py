@@ -0,0 +1,193 @@
+import copy
+import itertools
+import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from ami_game.game import ConfidentialityGame, multichoose
+from ami_game.population import Population
+
+# Parameters of ConfidentialityGame that can be swept, with their defaults
+GAME_PARAMETERS = {'K': 5, 'a': 0.3, 'attacker_budget': 1.0,
+                   'defender_budget': 1.5}
+# Factors applied to the attack and defence costs of every node
+COST_PARAMETERS = {'cost_attack_scale': 1.0, 'cost_defence_scale': 1.0}
+
+# State of a worker process, set up once by _initialize_worker
+_worker = {}
+
+def sweep_points(grid):
+    ''' Returns the list of parameter dictionaries spanned by a grid
+
+    Arguments:
+
+    grid: dictionary mapping parameter names to lists of values. Valid names
+          are K, a, attacker_budget, defender_budget, cost_attack_scale and
+          cost_defence_scale. Parameters not in the grid take their default
+          values
+    '''
+    for name in grid:
+        if name not in GAME_PARAMETERS and name not in COST_PARAMETERS:
+            raise ValueError('Unknown sweep parameter: '+str(name))
+    names = sorted(grid)
+    points = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        point = dict(GAME_PARAMETERS)
+        point.update(COST_PARAMETERS)
+        point.update(zip(names, values))
+        points.append(point)
+    return points
+
+def strategy_space_key(N, budget, K):
+    ''' Returns the key identifying the strategy space of N nodes with the
+    given budget and resolution K. The space only depends on the number of
+    units int(K*budget), stored as unit counts, so games with different K
+    and budgets but the same number of units share it '''
+    return (N, int(K*budget))
+
+def _initialize_worker(tree, spaces, settings):
+    ''' Attaches a worker process to the shared strategy spaces '''
+    _worker['tree'] = tree
+    _worker['settings'] = settings
+    _worker['memory'] = []
+    _worker['spaces'] = {}
+    for key, (name, shape, dtype) in spaces.items():
+        memory = shared_memory.SharedMemory(name=name)
+        strategies = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        strategies.flags.writeable = False
+        _worker['memory'].append(memory)
+        _worker['spaces'][key] = strategies
+
+def _run_point(index, point):
+    ''' Runs the population dynamics for one sweep point in a worker process
+    and returns the attack profiles, defence profiles and average utilities
+    of every generation and the instrumentation snapshot of the run '''
+    settings = _worker['settings']
+    tree = copy.deepcopy(_worker['tree'])
+    for node in tree:
+        node.cost_attack *= point['cost_attack_scale']
+        node.cost_defence *= point['cost_defence_scale']
+    game = ConfidentialityGame(tree, encoding='counts',
+            **dict((name, point[name]) for name in GAME_PARAMETERS))
+    game.attack_strategies = _worker['spaces'][strategy_space_key(
+            game.N, game.attacker_budget, game.K)]
+    game.defend_strategies = _worker['spaces'][strategy_space_key(
+            game.N, game.defender_budget, game.K)]
+
+    np.random.seed(settings['seed'] + index)
+    s = game.attacker_strategies()
+    t = game.defender_strategies()
+    population = Population(game, 1.0/len(s)*np.ones(len(s)),
+            1.0/len(t)*np.ones(len(t)), **settings['population'])
+
+    generations = settings['generations']
+    attack_profiles = np.zeros((generations+1, game.N))
+    defence_profiles = np.zeros((generations+1, game.N))
+    average_utility = np.zeros((generations+1, 2))
+    population.calculate_utilities()
+    for i in range(0, generations+1):
+        if i > 0:
+            population.replicate()
+        attack_profiles[i] = population.get_attack_profiles()
+        defence_profiles[i] = population.get_defence_profiles()
+        average_utility[i] = [population.get_average_attacker_utility(),
+                              population.get_average_defender_utility()]
+    return index, attack_profiles, defence_profiles, average_utility, \
+            population.instrumentation.snapshot()
+
+def run_sweep(tree, grid, generations=100, processes=None, output=None,
+              seed=0, cache=None, **population_arguments):
+    ''' Runs the population dynamics for every point of a parameter grid on
+    a pool of worker processes and returns the consolidated results
+
+    The strategy spaces are enumerated once per distinct number of units
+    int(K*budget) in the parent process and shared with the workers through
+    shared memory, as unit counts.
+
+    Arguments:
+
+    tree: list of Nodes defining the tree structure of the game
+    grid: dictionary mapping parameter names to lists of values, see
+          sweep_points
+    generations: the number of generations to run for every point
+    processes: the number of worker processes (defaults to the number of
+               cores)
+    output: optional file name to save the results to with np.savez
+    seed: seed of the random noise. Point i uses seed+i, so results do not
+          depend on the number of processes
+    cache: optional StrategyCache the strategy spaces are taken from
+           instead of enumerating them
+    population_arguments: keyword arguments passed on to Population, e.g.
+                          replicator, payoff, dt or delta. With
+                          instrument=True the results also hold the timings
+                          and counters of every point
+
+    Returns:
+
+    results: dictionary with the parameter names, a <number of points> x
+             <number of parameters> array of parameter values and the
+             attack_profiles, defence_profiles and average_utility of every
+             point stacked along the first axis. If instrumented, the
+             instrumentation snapshots of the points are listed under
+             'instrumentation' and saved as JSON strings
+    '''
+    points = sweep_points(grid)
+    names = sorted(points[0]) if points else []
+    N = len(tree)
+
+    # Enumerate every distinct strategy space once into shared memory
+    memories = []
+    spaces = {}
+    try:
+        for point in points:
+            for budget in (point['attacker_budget'],
+                           point['defender_budget']):
+                key = strategy_space_key(N, budget, point['K'])
+                if key in spaces:
+                    continue
+                if cache is None:
+                    strategies = multichoose(N, key[1],
+                            np.min_scalar_type(key[1]))
+                else:
+                    strategies = cache.strategies(N, key[1])
+                memory = shared_memory.SharedMemory(create=True,
+                        size=max(strategies.nbytes, 1))
+                memories.append(memory)
+                np.ndarray(strategies.shape, dtype=strategies.dtype,
+                        buffer=memory.buf)[:] = strategies
+                spaces[key] = (memory.name, strategies.shape,
+                               strategies.dtype.str)
+                del strategies
+
+        settings = {'generations': generations, 'seed': seed,
+                    'population': population_arguments}
+        results = [None]*len(points)
+        with ProcessPoolExecutor(max_workers=processes,
+                initializer=_initialize_worker,
+                initargs=(tree, spaces, settings)) as executor:
+            for index, attack_profiles, defence_profiles, average_utility, \
+                    snapshot in executor.map(_run_point, range(len(points)),
+                                             points):
+                results[index] = (attack_profiles, defence_profiles,
+                                  average_utility, snapshot)
+    finally:
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+
+    consolidated = {
+        'parameter_names': np.array(names),
+        'parameters': np.array([[point[name] for name in names]
+                                for point in points], dtype=float),
+        'attack_profiles': np.array([result[0] for result in results]),
+        'defence_profiles': np.array([result[1] for result in results]),
+        'average_utility': np.array([result[2] for result in results])}
+    if population_arguments.get('instrument'):
+        consolidated['instrumentation'] = [result[3] for result in results]
+    if output is not None:
+        saved = dict(consolidated)
+        if 'instrumentation' in saved:
+            saved['instrumentation'] = np.array([json.dumps(snapshot)
+                    for snapshot in saved['instrumentation']])
+        np.savez(output, **saved)
+    return consolidated
@@ -0,0 +1,168 @@
+import numpy as np
+
+def isomorphism_classes(game):
+    ''' Returns an integer numpy array of size <number of nodes in tree>
+    giving the isomorphism class of the subtree below every node. Two nodes
+    are in the same class if their values and costs are equal and their
+    children can be matched pairwise to nodes of the same class
+
+    Arguments:
+
+    game: a ConfidentialityGame object with a compiled tree
+    '''
+    classes = -np.ones(game.N, dtype=np.intp)
+    keys = {}
+    for ni in reversed(tree_order(game)):
+        children = game.child_indices[game.child_offsets[ni]:
+                                      game.child_offsets[ni+1]]
+        key = (game.values[ni], game.costs_attack[ni],
+               game.costs_defence[ni], tuple(sorted(classes[children])))
+        classes[ni] = keys.setdefault(key, len(keys))
+    return classes
+
+def node_orbits(game, classes):
+    ''' Returns an integer numpy array of size <number of nodes in tree>
+    giving the orbit of every node under the automorphisms of the tree, i.e.
+    the permutations of isomorphic sibling subtrees. Two nodes are in the
+    same orbit if they are of the same class and so are their parents '''
+    orbits = -np.ones(game.N, dtype=np.intp)
+    keys = {}
+    for ni in tree_order(game):
+        parent = game.parent[ni]
+        key = (-1 if parent < 0 else orbits[parent], classes[ni])
+        orbits[ni] = keys.setdefault(key, len(keys))
+    return orbits
+
+def tree_order(game):
+    ''' Returns the nodes in breadth-first order from the roots '''
+    order = list(np.flatnonzero(game.parent < 0))
+    for ni in order:
+        order.extend(game.child_indices[game.child_offsets[ni]:
+                                        game.child_offsets[ni+1]])
+    return order
+
+def orbit_strategies(game, units, classes):
+    ''' Returns one representative of every orbit of the strategies that
+    distribute a number of units over the nodes, and the number of
+    strategies in every orbit. The representatives are enumerated directly
+    from the subtree classes, without enumerating the full strategy space.
+    The allocations to isomorphic sibling subtrees of a representative are
+    a multiset of representatives of the subtree, so every orbit is found
+    once, and its size is the number of arrangements of the multiset times
+    the orbit sizes of its elements
+
+    Arguments:
+
+    game: a ConfidentialityGame object with a compiled tree in which every
+          node has at most one parent
+    units: the number of units to distribute
+    classes: the isomorphism classes of the nodes, see isomorphism_classes
+
+    Returns:
+
+    strategies: integer numpy array of size <number of orbits> x <number of
+                nodes in tree> giving the unit counts of the representatives
+    multiplicities: integer numpy array of size <number of orbits>
+    '''
+    tables = {}
+    roots = np.flatnonzero(game.parent < 0)
+    rows, multiplicities = _children_table(game, roots, units, classes,
+                                           tables)[units]
+    strategies = np.zeros((rows.shape[0], game.N), dtype=np.int64)
+    strategies[:, _preorder(game, roots, classes)] = rows
+    return strategies, multiplicities
+
+def _preorder(game, nodes, classes):
+    ''' Returns the subtrees of the given nodes in pre-order, with siblings
+    sorted by class. This is the column order of the tables of
+    _node_table '''
+    order = []
+    for ni in sorted(nodes, key=lambda ni: classes[ni]):
+        order.append(ni)
+        order.extend(_preorder(game, game.child_indices[
+                game.child_offsets[ni]:game.child_offsets[ni+1]], classes))
+    return order
+
+def _node_table(game, ni, units, classes, tables):
+    ''' Returns the representatives of the allocations of 0 to units units
+    over the subtree of a node as a list of (rows, multiplicities) pairs,
+    one per number of units. Tables are shared by all nodes of a class '''
+    if classes[ni] not in tables:
+        children = _children_table(game, game.child_indices[
+                game.child_offsets[ni]:game.child_offsets[ni+1]], units,
+                classes, tables)
+        table = []
+        for u in range(0, units+1):
+            table.append(_concatenate([(np.hstack([
+                    np.full((children[u-x][0].shape[0], 1), x, np.int64),
+                    children[u-x][0]]), children[u-x][1])
+                    for x in range(0, u+1)]))
+        tables[classes[ni]] = table
+    return tables[classes[ni]]
+
+def _children_table(game, nodes, units, classes, tables):
+    ''' Returns the representatives of the allocations of 0 to units units
+    over the subtrees of a set of sibling nodes, see _node_table '''
+    table = [(np.zeros((1, 0), np.int64), np.ones(1, np.int64))] \
+            + [(np.zeros((0, 0), np.int64), np.zeros(0, np.int64))]*units
+    nodes = sorted(nodes, key=lambda ni: classes[ni])
+    start = 0
+    while start < len(nodes):
+        end = start
+        while end < len(nodes) and classes[nodes[end]] == classes[nodes[start]]:
+            end += 1
+        copies = _multisets(_node_table(game, nodes[start], units, classes,
+                                        tables), end-start, units)
+        table = [_concatenate([_product(table[x], copies[u-x])
+                               for x in range(0, u+1)])
+                 for u in range(0, units+1)]
+        start = end
+    return table
+
+def _multisets(table, copies, units):
+    ''' Returns the representatives of the allocations of 0 to units units
+    over a number of copies of an isomorphic subtree, i.e. the multisets of
+    its representatives, with the number of allocations each stands for '''
+    elements = np.vstack([rows for rows, _ in table])
+    element_units = np.concatenate([np.full(rows.shape[0], u, np.int64)
+                                    for u, (rows, _) in enumerate(table)])
+    element_multiplicities = np.concatenate([m for _, m in table])
+    # Multisets are grown one copy at a time with non-decreasing elements.
+    # coefficients holds the number of arrangements k!/prod(runs!) and run
+    # the length of the run of the last element
+    chosen = np.zeros((1, 0), np.intp)
+    last = -np.ones(1, np.intp)
+    used = np.zeros(1, np.int64)
+    coefficients = np.ones(1, np.int64)
+    run = np.zeros(1, np.int64)
+    multiplicities = np.ones(1, np.int64)
+    for k in range(1, copies+1):
+        grown = []
+        for e in range(0, elements.shape[0]):
+            index = np.flatnonzero((last <= e)
+                                   & (used + element_units[e] <= units))
+            new_run = np.where(last[index] == e, run[index]+1, 1)
+            grown.append((np.hstack([chosen[index],
+                                     np.full((index.size, 1), e, np.intp)]),
+                          used[index] + element_units[e],
+                          coefficients[index]*k//new_run, new_run,
+                          multiplicities[index]*element_multiplicities[e]))
+        chosen, used, coefficients, run, multiplicities = \
+                [np.concatenate(parts) for parts in zip(*grown)]
+        last = chosen[:, -1]
+    rows = elements[chosen].reshape(chosen.shape[0], -1)
+    return [(rows[used == u], (coefficients*multiplicities)[used == u])
+            for u in range(0, units+1)]
+
+def _product(first, second):
+    ''' Returns all combinations of the rows of two tables, with the
+    product of their multiplicities '''
+    rows = np.hstack([np.repeat(first[0], second[0].shape[0], axis=0),
+                      np.tile(second[0], (first[0].shape[0], 1))])
+    return rows, np.outer(first[1], second[1]).ravel()
+
+def _concatenate(parts):
+    ''' Returns the rows and multiplicities of a list of tables stacked '''
+    columns = max(rows.shape[1] for rows, _ in parts)
+    return np.vstack([rows.reshape(-1, columns) for rows, _ in parts]), \
+            np.concatenate([m for _, m in parts])
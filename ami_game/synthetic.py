@@ -0,0 +1,76 @@
+import numpy as np
+from ami_game.node import Node
+
+# Node types as used in node_types.txt
+HES = 0
+COLLECTOR = 1
+METER_COLLECTOR = 2
+METER = 3
+
+def synthetic_tree(collectors=2, fanout=3, depth=2, meter_value=3.0,
+                   a=0.0, jitter=0.0, seed=None):
+    ''' Returns a synthetic AMI tree: a head-end system (HES) at the root,
+    collectors below it, depth-1 levels of meter/collectors and meters at
+    the leaves. The value of every inner node is the total value of its
+    children plus a meter value of its own, and costs follow the ratios of
+    case_study_1. Nodes are listed breadth first.
+
+    Arguments:
+
+    collectors: the number of collectors below the HES
+    fanout: the number of children of every collector and meter/collector
+    depth: the number of levels below the collectors (at least 1)
+    meter_value: the value of a meter
+    a: the detection rate the costs are validated against
+    jitter: relative random perturbation of values and costs, which breaks
+            the symmetry between otherwise identical nodes
+    seed: seed of the random perturbation
+
+    Returns:
+
+    tree: list of Nodes
+    types: integer numpy array of size <number of nodes in tree> x 2 giving
+           the type and level of every node, as in node_types.txt
+    '''
+    if depth < 1:
+        raise ValueError('depth must be at least 1')
+    random = np.random.RandomState(seed)
+    root = Node()
+    tree = [root]
+    types = [(HES, 0)]
+    level = [root]
+    for d in range(1, depth+2):
+        next_level = []
+        for parent in level:
+            for _ in range(0, collectors if d == 1 else fanout):
+                node = Node()
+                parent.add_child(node)
+                next_level.append(node)
+                tree.append(node)
+                if d == 1:
+                    types.append((COLLECTOR, d))
+                elif d == depth+1:
+                    types.append((METER, d))
+                else:
+                    types.append((METER_COLLECTOR, d))
+        level = next_level
+
+    # Values accumulate from the meters up, costs follow case_study_1
+    for node in reversed(tree):
+        node.value = meter_value*(1.0 + jitter*random.uniform(-1, 1)) \
+                + sum(child.value for child in node.children)
+        if node.children:
+            node.cost_attack = min(0.3*node.value, 10.0)
+            node.cost_defence = 0.6
+        else:
+            node.cost_attack = 0.01
+            node.cost_defence = 0.8
+        node.cost_attack *= 1.0 + jitter*random.uniform(-1, 1)
+        node.cost_defence *= 1.0 + jitter*random.uniform(-1, 1)
+        node.validate(a)
+    return tree, np.array(types, dtype=int)
+
+def write_node_types(filename, types):
+    ''' Writes the types and levels of the nodes of a tree to a file in the
+    format of node_types.txt '''
+    np.savetxt(filename, types, fmt='%d', header='Type Level')
@@ -0,0 +1,192 @@
+''' Accuracy check of mean-field profile dynamics against REQN dynamics.
+
+Evolving the attack and defence profiles directly would cost O(N) per
+generation, whatever the size of the strategy spaces. Under the replicator
+equation a linear utility moves the profile x by C w, with C the covariance
+of the strategies of the population and w the payoff weights against the
+opponent profile, so the profiles only follow the full dynamics as far as C
+can be closed in terms of x. This script closes it with the covariance of a
+population spread over the strategies as by a Dirichlet distribution, which
+is exact for the first generation from uniform populations, runs the game of
+every case study with it and with the full REQN replicator, and reports the
+time per generation of both, the largest deviation of the attack profiles,
+defence profiles and average utilities over the whole trajectory, that of
+the profiles at the last generation, and the first generation at which a
+profile deviates by more than the tolerance:
+
+    python benchmarks/check_meanfield.py --generations 100
+
+The closure only holds while the noise keeps the populations spread, e.g. on
+case_study_1 with --dt 0.01 --delta 1000. With the settings of the case
+studies both depart at generation 3, as selection concentrates the
+populations on a few strategies that no closure in x alone describes: even
+the true covariance leaves an error of about 0.09 on case_study_1, from the
+negative populations REQN removes strategy by strategy. The mean-field
+dynamics are therefore not part of ami_game.
+'''
+import argparse
+import logging
+import os
+import runpy
+import sys
+import time
+import numpy as np
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from ami_game.cache import default_cache
+from ami_game.game import ConfidentialityGame, number_of_strategies
+from ami_game.population import Population
+
+# Case study folders with the REQN settings of their case.py
+CASES = [('case_study_1', {'dt': 0.1, 'delta': 100.0}),
+         ('case_study_2', {'dt': 0.1, 'delta': 0.1})]
+
+class MeanField(object):
+    ''' Mean-field approximation of the REQN dynamics of a Population from
+    uniform populations, offering the getters used by trajectory '''
+
+    def __init__(self, game, dt=0.1, delta=0.1):
+        ''' Constructor for the MeanField class
+
+        Arguments:
+
+        game: a ConfidentialityGame object, whose strategy spaces are never
+              enumerated
+        dt, delta: as for Population
+        '''
+        self.game = game
+        self.dt = dt
+        N = game.N
+        attacker_units = int(game.K*game.attacker_budget)
+        defender_units = int(game.K*game.defender_budget)
+        self.attacker_budget = attacker_units/float(game.K)
+        self.defender_budget = defender_units/float(game.K)
+        # Population scales the noise by the number of attacker strategies,
+        # and adds a population of half of it on average
+        self.noise = 0.5*delta/float(number_of_strategies(N, attacker_units))
+        # Covariance factor of a Dirichlet spread of concentration N, that of
+        # uniform populations
+        self.attacker_scale = (attacker_units + N)/(game.K*(1.0 + N))
+        self.defender_scale = (defender_units + N)/(game.K*(1.0 + N))
+        self.attack_profile = np.full(N, self.attacker_budget/N)
+        self.defence_profile = np.full(N, self.defender_budget/N)
+
+    def replicate(self):
+        ''' Updates the attack and defence profiles by one generation '''
+        weights_attacker, constant_attacker = \
+                self.game.attacker_payoff_weights(self.defence_profile)
+        weights_defender, constant_defender = \
+                self.game.defender_payoff_weights(self.attack_profile)
+        self.average_utility_attacker = np.dot(self.attack_profile,
+                weights_attacker) + constant_attacker
+        self.average_utility_defender = np.dot(self.defence_profile,
+                weights_defender) + constant_defender
+        self.attack_profile = self.step(self.attack_profile,
+                weights_attacker, self.attacker_budget, self.attacker_scale)
+        self.defence_profile = self.step(self.defence_profile,
+                weights_defender, self.defender_budget, self.defender_scale)
+
+    def step(self, profile, weights, budget, scale):
+        ''' Returns a profile after an Euler step of the closed replicator
+        equation, the expected noise, spread evenly over the strategies,
+        removal of negative rates and normalization to the budget '''
+        N = profile.shape[0]
+        profile = profile + self.dt*scale*profile*(weights
+                - np.dot(profile, weights)/budget)
+        profile += self.noise*budget/N
+        profile[profile < 0] = 0
+        return budget*profile/np.sum(profile)
+
+    def get_attack_profiles(self):
+        ''' Returns the attack profile '''
+        return self.attack_profile.copy()
+
+    def get_defence_profiles(self):
+        ''' Returns the defence profile '''
+        return self.defence_profile.copy()
+
+    def get_average_attacker_utility(self):
+        ''' Returns the average attacker utility that was last calculated '''
+        return self.average_utility_attacker
+
+    def get_average_defender_utility(self):
+        ''' Returns the average defender utility that was last calculated '''
+        return self.average_utility_defender
+
+def load_game(case):
+    ''' Returns the game of a case study, with its strategies stored as unit
+    counts to keep the memory of the full dynamics down and cached between
+    runs '''
+    game = runpy.run_path(os.path.join(ROOT, case, 'case.py'),
+                          run_name='case')['game']
+    return ConfidentialityGame(game.tree, K=game.K, a=game.a,
+            attacker_budget=game.attacker_budget,
+            defender_budget=game.defender_budget, encoding='counts',
+            cache=default_cache())
+
+def trajectory(population, generations):
+    ''' Returns the attack profiles, defence profiles and average utilities
+    of every generation of a run, and the mean time per generation '''
+    N = population.game.N
+    attack_profiles = np.zeros((generations, N))
+    defence_profiles = np.zeros((generations, N))
+    average_utility = np.zeros((generations, 2))
+    seconds = 0.0
+    for i in range(0, generations):
+        start = time.perf_counter()
+        population.replicate()
+        seconds += time.perf_counter() - start
+        attack_profiles[i] = population.get_attack_profiles()
+        defence_profiles[i] = population.get_defence_profiles()
+        average_utility[i] = [population.get_average_attacker_utility(),
+                              population.get_average_defender_utility()]
+    return (attack_profiles, defence_profiles, average_utility), \
+            seconds/max(generations, 1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--generations', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tolerance', type=float, default=0.05,
+            help='profile deviation that counts as a departure')
+    parser.add_argument('--cases', nargs='*', default=[c for c, _ in CASES],
+            help='case study folders to compare')
+    parser.add_argument('--dt', type=float,
+            help='time step instead of that of the case studies')
+    parser.add_argument('--delta', type=float,
+            help='noise parameter instead of that of the case studies')
+    arguments = parser.parse_args(argv)
+    # Keep the node tables that the games log at level INFO quiet
+    logging.basicConfig(level=logging.WARNING)
+
+    print('{0:<14}{1:>12}{2:>10}{3:>10}{4:>10}{5:>10}{6:>10}{7:>10}{8:>9}'
+          .format('Case', 'Strategies', 'Full s', 'Mean s', 'Attack',
+                  'Defence', 'Utility', 'Final', 'Departs'))
+    for case, settings in CASES:
+        if case not in arguments.cases:
+            continue
+        settings = dict(settings)
+        for name in ('dt', 'delta'):
+            if getattr(arguments, name) is not None:
+                settings[name] = getattr(arguments, name)
+        game = load_game(case)
+        S = game.attacker_strategies().shape[0]
+        T = game.defender_strategies().shape[0]
+        np.random.seed(arguments.seed)
+        full, full_seconds = trajectory(Population(game, np.ones(S)/S,
+                np.ones(T)/T, payoff='profile', **settings),
+                arguments.generations)
+        mean, mean_seconds = trajectory(MeanField(game, **settings),
+                arguments.generations)
+        deviations = [np.max(np.abs(f - m), axis=1)
+                      for f, m in zip(full, mean)]
+        profile_deviations = np.maximum(deviations[0], deviations[1])
+        departed = np.flatnonzero(profile_deviations > arguments.tolerance)
+        print('{0:<14}{1:>12d}{2:>10.2e}{3:>10.2e}{4:>10.2e}{5:>10.2e}'
+              '{6:>10.2e}{7:>10.2e}{8:>9}'.format(case, S+T, full_seconds,
+                    mean_seconds, *([np.max(d) for d in deviations]
+                                    + [profile_deviations[-1]]),
+                    departed[0]+1 if departed.size else '-'))
+
+if __name__ == '__main__':
+    main()
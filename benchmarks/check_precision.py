@@ -0,0 +1,77 @@
+''' Accuracy check of the reduced-precision strategy and population storage.
+
+Runs the same game with float64 strategies and populations, with strategies
+stored as unit counts, and with float32 populations, and reports the
+memory of the strategy spaces and the largest deviation of the attack
+profiles, defence profiles and average utilities from the float64 run over
+the whole trajectory:
+
+    python benchmarks/check_precision.py --generations 200
+'''
+import argparse
+import os
+import sys
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from ami_game.game import ConfidentialityGame
+from ami_game.population import Population
+from ami_game.synthetic import synthetic_tree
+
+# Configurations compared to the float64 run, as (name, encoding, dtype)
+CONFIGURATIONS = [('float64', 'float', np.float64),
+                  ('counts', 'counts', np.float64),
+                  ('counts+float32', 'counts', np.float32)]
+
+def trajectory(game, generations, seed, **population_arguments):
+    ''' Returns the attack profiles, defence profiles and average utilities
+    of every generation of a run from uniform populations '''
+    np.random.seed(seed)
+    S = game.attacker_strategies().shape[0]
+    T = game.defender_strategies().shape[0]
+    population = Population(game, np.ones(S)/S, np.ones(T)/T,
+                            **population_arguments)
+    attack_profiles = np.zeros((generations, game.N))
+    defence_profiles = np.zeros((generations, game.N))
+    average_utility = np.zeros((generations, 2))
+    for i in range(0, generations):
+        population.replicate()
+        attack_profiles[i] = population.get_attack_profiles()
+        defence_profiles[i] = population.get_defence_profiles()
+        average_utility[i] = [population.get_average_attacker_utility(),
+                              population.get_average_defender_utility()]
+    return attack_profiles, defence_profiles, average_utility
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--generations', type=int, default=200)
+    parser.add_argument('--K', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--shape', type=int, nargs=3, default=[2, 3, 1],
+            help='collectors, fanout and depth of the synthetic tree')
+    arguments = parser.parse_args(argv)
+
+    tree, _ = synthetic_tree(*arguments.shape, jitter=0.1, seed=0)
+    print('{0:<16}{1:<12}{2:<10}{3:>14}{4:>12}{5:>12}{6:>12}'.format(
+            'Configuration', 'Replicator', 'Payoff', 'Strategy MB',
+            'Attack', 'Defence', 'Utility'))
+    for replicator, payoff in [('REQN', 'profile'), ('REQN', 'matrix'),
+                               ('truncation', 'profile')]:
+        reference = None
+        for name, encoding, dtype in CONFIGURATIONS:
+            game = ConfidentialityGame(tree, K=arguments.K, a=0.0,
+                                       encoding=encoding)
+            result = trajectory(game, arguments.generations, arguments.seed,
+                    replicator=replicator, payoff=payoff, dtype=dtype)
+            if reference is None:
+                reference = result
+            deviations = [np.max(np.abs(r - x))
+                          for r, x in zip(reference, result)]
+            megabytes = (game.attacker_strategies().nbytes
+                         + game.defender_strategies().nbytes)/2.0**20
+            print('{0:<16}{1:<12}{2:<10}{3:>14.3f}{4:>12.2e}{5:>12.2e}'
+                  '{6:>12.2e}'.format(name, replicator, payoff, megabytes,
+                                      *deviations))
+
+if __name__ == '__main__':
+    main()
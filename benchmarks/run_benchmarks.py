@@ -0,0 +1,148 @@
+''' Performance benchmarks of ami_game on synthetic AMI trees.
+
+Times strategy enumeration, the utility functions and one generation of
+Population.replicate for both replicators over a grid of tree sizes,
+resolutions and budgets, and writes the timings and peak memory to a JSON
+file so that regressions can be tracked over time:
+
+    python benchmarks/run_benchmarks.py --output bench.json
+'''
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from ami_game.game import ConfidentialityGame, multichoose, \
+        number_of_strategies
+from ami_game.population import Population
+from ami_game.synthetic import synthetic_tree
+
+# Tree shapes as (collectors, fanout, depth)
+TREES = [(2, 2, 1), (2, 3, 1), (2, 2, 2), (3, 3, 1), (2, 3, 2)]
+RESOLUTIONS = [2, 3]
+BUDGETS = [(1.0, 1.0), (1.0, 1.5)]
+PAYOFFS = ['direct', 'matrix', 'profile']
+# Replicators with the keyword arguments that select them
+REPLICATORS = {'REQN': {'replicator': 'REQN'},
+               'truncation': {'replicator': 'truncation'},
+               'incremental truncation': {'replicator': 'truncation',
+                                          'incremental': True}}
+
+def measure(function, repeat, setup=None):
+    ''' Returns the best wall time of repeat calls of function and the peak
+    memory allocated during one further call. If setup is given, it is
+    called untimed before every call and its result passed to function '''
+    seconds = float('inf')
+    for repetition in range(0, repeat+1):
+        argument = () if setup is None else (setup(),)
+        if repetition == repeat:
+            tracemalloc.start()
+            function(*argument)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            function(*argument)
+            seconds = min(seconds, time.perf_counter() - start)
+    return seconds, peak
+
+def benchmark_case(shape, K, budgets, repeat, max_pairs, workers=1):
+    ''' Returns the benchmark results of one tree shape, resolution and
+    pair of budgets, evaluating the strategy blocks on the given number of
+    threads '''
+    tree, _ = synthetic_tree(*shape, jitter=0.1, seed=0)
+    game = ConfidentialityGame(tree, K=K, a=0.0,
+            attacker_budget=budgets[0], defender_budget=budgets[1],
+            workers=workers)
+    units = int(K*budgets[0])
+    S = number_of_strategies(game.N, units)
+    T = number_of_strategies(game.N, int(K*budgets[1]))
+    case = {'N': game.N, 'K': K, 'attacker_budget': budgets[0],
+            'defender_budget': budgets[1], 'attacker_strategies': S,
+            'defender_strategies': T, 'workers': workers}
+    results = []
+
+    def record(benchmark, timing, **extra):
+        result = dict(case, benchmark=benchmark, seconds=timing[0],
+                      peak_bytes=timing[1])
+        result.update(extra)
+        results.append(result)
+
+    record('multichoose', measure(lambda: multichoose(game.N, units),
+                                  repeat))
+    s = game.attacker_strategies()
+    t = game.defender_strategies()
+    record('attacker_utility', measure(
+            lambda: game.attacker_utility(s[0], t), repeat))
+    record('defender_utility', measure(
+            lambda: game.defender_utility(s, t[0]), repeat))
+    if S*T <= max_pairs:
+        record('attacker_utility_matrix', measure(
+                lambda: game.attacker_utility_matrix(s, t), repeat))
+        record('defender_utility_matrix', measure(
+                lambda: game.defender_utility_matrix(s, t), repeat))
+
+    for payoff, replicator in itertools.product(PAYOFFS, sorted(REPLICATORS)):
+        if payoff != 'profile' and S*T > max_pairs:
+            continue
+        def setup():
+            np.random.seed(0)
+            population = Population(game, np.ones(S)/S, np.ones(T)/T,
+                    payoff=payoff, **REPLICATORS[replicator])
+            # Time a generation after the first, which incremental payoffs
+            # need to evaluate in full
+            population.replicate()
+            return population
+        record('replicate', measure(lambda population:
+                population.replicate(), repeat, setup), payoff=payoff,
+               replicator=replicator)
+    return results
+
+def metadata():
+    ''' Returns a description of the environment of the benchmark run '''
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': commit, 'python': platform.python_version(),
+            'numpy': np.__version__, 'platform': platform.platform(),
+            'processor': platform.processor()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--output', default='bench.json',
+            help='JSON file to write the results to')
+    parser.add_argument('--repeat', type=int, default=3,
+            help='number of timed repetitions, the best is reported')
+    parser.add_argument('--max-pairs', type=int, default=10**6,
+            help='largest S x T for the direct and matrix payoff modes')
+    parser.add_argument('--quick', action='store_true',
+            help='only run the smallest tree and resolution')
+    parser.add_argument('--workers', type=int, default=1,
+            help='number of threads evaluating the strategy blocks')
+    arguments = parser.parse_args(argv)
+
+    trees = TREES[:1] if arguments.quick else TREES
+    resolutions = RESOLUTIONS[:1] if arguments.quick else RESOLUTIONS
+    results = []
+    for shape, K, budgets in itertools.product(trees, resolutions, BUDGETS):
+        print('Benchmarking tree {0} with K={1} and budgets {2}'.format(
+                shape, K, budgets))
+        results.extend(benchmark_case(shape, K, budgets, arguments.repeat,
+                                      arguments.max_pairs, arguments.workers))
+    with open(arguments.output, 'w') as f:
+        json.dump({'metadata': metadata(), 'results': results}, f, indent=1)
+    print('Wrote {0} results to {1}'.format(len(results), arguments.output))
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,14 @@
+import logging
 import numpy as np
-import pickle
 import sys
 sys.path.append("..")
+from ami_game.cache import default_cache
 from ami_game.game import ConfidentialityGame
 from ami_game.population import Population
 from ami_game.node import Node
+from ami_game.convergence import ConvergenceMonitor
+from ami_game.recorder import TrajectoryRecorder
+from ami_game.checkpoint import save_checkpoint
 
 # Generate tree
 n1 = Node()
@@ -105,61 +109,53 @@ n7.add_child(n15)
 
 tree = [n1, n2, n3, n4, n5, n6, n7, n8, n9, n10, n11, n12, n13, n14, n15]
 
-# Initialize game and get strategy spaces
-game = ConfidentialityGame(tree, K=3, a=0.0, defender_budget=1.0)
-
-print('Validating parameters')
-for node in tree:
-    node.validate(game.a)
-
-s = game.attacker_strategies()
-t = game.defender_strategies()
-
-# Generate initial populations
-attacker_population = 1.0/len(s)*np.ones(len(s))
-defender_population = 1.0/len(t)*np.ones(len(t))
-
-population = Population(game, attacker_population, defender_population,
-        dt=0.1, delta=100.0)
-
-attack_profiles = np.zeros((0, len(tree)))
-defence_profiles = np.zeros((0, len(tree)))
-average_utility = np.zeros((0, 2))
-
-population.calculate_utilities()
-average_utility = np.append(average_utility,
-            np.array([population.get_average_attacker_utility(),
-                      population.get_average_defender_utility()])[np.newaxis],
-            axis=0)
-# Calculating attack profile
-attack_profiles = np.append(attack_profiles,
-        population.get_attack_profiles()[np.newaxis], axis=0)
-# Calculating defence profile
-defence_profiles = np.append(defence_profiles,
-        population.get_defence_profiles()[np.newaxis],
-        axis=0)
-
-# Evolove population
-N_populations = 200
-for i in range(0, N_populations):
-    print('Population number '+str(i))
-    # Copy population
-    population.replicate()
-    average_utility = np.append(average_utility,
-            np.array([population.get_average_attacker_utility(),
-                      population.get_average_defender_utility()])[np.newaxis],
-            axis=0)
-    # Calculating attack profile
-    attack_profiles = np.append(attack_profiles,
-            population.get_attack_profiles()[np.newaxis], axis=0)
-    # Calculating defence profile
-    defence_profiles = np.append(defence_profiles,
-            population.get_defence_profiles()[np.newaxis],
-            axis=0)
-
-np.savetxt('attackers', attack_profiles)
-np.savetxt('defenders', defence_profiles)
-np.savetxt('utility', average_utility)
-
-# Save for future continue
-pickle.dump(population, open('population_dump', 'wb'))
+# Initialize game. The strategies are stored as unit counts, so that the
+# cached strategy spaces are memory-mapped and shared between the players
+game = ConfidentialityGame(tree, K=3, a=0.0, defender_budget=1.0,
+        encoding='counts')
+
+# The simulation only runs as a script, so that the tree and game can be
+# loaded by other scripts, e.g. benchmarks/check_meanfield.py
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    # The game was set up before logging was configured
+    game.log_nodes()
+
+    # Strategy spaces are cached between runs (see ami_game/cache.py)
+    game.cache = default_cache()
+
+    logging.info('Validating parameters')
+    for node in tree:
+        node.validate(game.a)
+
+    s = game.attacker_strategies()
+    t = game.defender_strategies()
+
+    # Generate initial populations
+    attacker_population = 1.0/len(s)*np.ones(len(s))
+    defender_population = 1.0/len(t)*np.ones(len(t))
+
+    population = Population(game, attacker_population, defender_population,
+            dt=0.1, delta=100.0)
+
+    # Record profiles and utilities to attackers.npy, defenders.npy and
+    # utility.npy
+    recorder = TrajectoryRecorder('.', len(tree))
+
+    population.calculate_utilities()
+    recorder.record(population)
+
+    # Evolove population until it has settled, at most N_populations
+    # generations
+    N_populations = 200
+    monitor = ConvergenceMonitor(tolerance=0.1, utility_tolerance=0.05,
+            patience=3, window=20)
+    population.run(N_populations, observers=[recorder, monitor],
+            log_interval=20)
+    if monitor.converged():
+        logging.info('Population has converged')
+
+    recorder.close()
+
+    # Save for future continue
+    save_checkpoint(population, 'population_checkpoint.npz')
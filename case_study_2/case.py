@@ -1,238 +1,238 @@
+import logging
 import numpy as np
-import pickle
-import pydot
 import sys
 sys.path.append("..")
+from ami_game.cache import default_cache
 from ami_game.game import ConfidentialityGame
 from ami_game.population import Population
 from ami_game.node import Node
+from ami_game.recorder import TrajectoryRecorder
+from ami_game.checkpoint import save_checkpoint, load_checkpoint
+
+# Generate tree
+n1 = Node()
+n1.value = 65.0
+n1.cost_attack = 0.2
+n1.cost_defence = 0.05
+
+# The root node is its own parent. Cut value by half to avoid inconsitency
+n1.value = n1.value*0.5
+
+###
+
+n2 = Node()
+n2.value = 20.0
+n2.cost_attack = 0.2
+n2.cost_defence = 0.05
+
+n3 = Node()
+n3.value = 40.0
+n3.cost_attack = 0.2
+n3.cost_defence = 0.05
+
+n1.add_child(n2)
+n1.add_child(n3)
+
+###
+
+n4 = Node()
+n4.value = 14.0
+n4.cost_attack = 0.2
+n4.cost_defence = 0.05
+
+n5 = Node()
+n5.value = 6.0
+n5.cost_attack = 0.2
+n5.cost_defence = 0.05
+
+n6 = Node()
+n6.value = 29.0
+n6.cost_attack = 0.2
+n6.cost_defence = 0.05
+
+n7 = Node()
+n7.value = 4.0
+n7.cost_attack = 0.2
+n7.cost_defence = 0.05
+
+n8 = Node()
+n8.value = 15.0
+n8.cost_attack = 0.2
+n8.cost_defence = 0.05
+
+n2.add_child(n4)
+n2.add_child(n5)
+n3.add_child(n6)
+n3.add_child(n7)
+n3.add_child(n8)
+
+###
+
+n9 = Node()
+n9.value = 1.0
+n9.cost_attack = 0.2
+n9.cost_defence = 0.05
+
+n10 = Node()
+n10.value = 2.0
+n10.cost_attack = 0.2
+n10.cost_defence = 0.05
+
+n11 = Node()
+n11.value = 1.0
+n11.cost_attack = 0.2
+n11.cost_defence = 0.05
+
+n12 = Node()
+n12.value = 5.0
+n12.cost_attack = 0.2
+n12.cost_defence = 0.05
+
+n4.add_child(n9)
+n4.add_child(n10)
+n4.add_child(n11)
+n4.add_child(n12)
+
+###
+
+n13 = Node()
+n13.value = 3.0
+n13.cost_attack = 0.2
+n13.cost_defence = 0.05
+
+n14 = Node()
+n14.value = 1.5
+n14.cost_attack = 0.2
+n14.cost_defence = 0.05
+
+n5.add_child(n13)
+n5.add_child(n14)
+
+###
+
+n15 = Node()
+n15.value = 1.0
+n15.cost_attack = 0.2
+n15.cost_defence = 0.05
+
+n16 = Node()
+n16.value = 4.0
+n16.cost_attack = 0.2
+n16.cost_defence = 0.05
+
+n17 = Node()
+n17.value = 6.0
+n17.cost_attack = 0.2
+n17.cost_defence = 0.05
+
+n18 = Node()
+n18.value = 4.0
+n18.cost_attack = 0.2
+n18.cost_defence = 0.05
+
+n19 = Node()
+n19.value = 3.0
+n19.cost_attack = 0.2
+n19.cost_defence = 0.05
+
+n6.add_child(n15)
+n6.add_child(n16)
+n6.add_child(n17)
+n6.add_child(n18)
+n6.add_child(n19)
+
+###
+
+n20 = Node()
+n20.value = 1.0
+n20.cost_attack = 0.2
+n20.cost_defence = 0.05
+
+n21 = Node()
+n21.value = 1.5
+n21.cost_attack = 0.2
+n21.cost_defence = 0.05
+
+n7.add_child(n20)
+n7.add_child(n21)
+
+###
+
+n22 = Node()
+n22.value = 3.0
+n22.cost_attack = 0.2
+n22.cost_defence = 0.05
+
+n23 = Node()
+n23.value = 5.0
+n23.cost_attack = 0.2
+n23.cost_defence = 0.05
+
+n24 = Node()
+n24.value = 1.5
+n24.cost_attack = 0.2
+n24.cost_defence = 0.05
+
+n8.add_child(n22)
+n8.add_child(n23)
+n8.add_child(n24)
+
+
+tree = [n1, n2, n3, n4, n5, n6, n7, n8, n9, n10, n11, n12, n13, n14,
+        n15, n16, n17, n18, n19, n20, n21, n22, n23, n24]
+
+# Initialize game. The strategies are stored as unit counts, so that the
+# cached strategy spaces are memory-mapped instead of held as float arrays
+game = ConfidentialityGame(tree, K=2, a=0.6, attacker_budget=1.0,
+        defender_budget=4.0, encoding='counts')
+
+# The simulation only runs as a script, so that the tree and game can be
+# loaded by other scripts, e.g. benchmarks/check_meanfield.py
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    # The game was set up before logging was configured
+    game.log_nodes()
+
+    # Strategy spaces are cached between runs (see ami_game/cache.py)
+    game.cache = default_cache()
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'continue':
+        # The game is set up again from the definition above, only the state
+        # of the populations is restored
+        logging.info('Continuing on previous simulation')
+        population = load_checkpoint('population_checkpoint.npz', game)
+        recorder = TrajectoryRecorder('.', len(tree), append=True)
+
+    else:
+        logging.info('Calculating strategy spaces')
+        s = game.attacker_strategies()
+        t = game.defender_strategies()
+
+        # Generate initial populations
+        logging.info('Setting up initial populations')
+        attacker_population = 1.0/len(s)*np.ones(len(s))
+        defender_population = 1.0/len(t)*np.ones(len(t))
+
+        # The strategy spaces are too large to evaluate every strategy pair,
+        # so the payoffs are evaluated against the opponent profiles
+        population = Population(game, attacker_population,
+                defender_population, k=0.2, payoff='profile')
+
+        recorder = TrajectoryRecorder('.', len(tree))
+
+    # Evolove population, checkpointing every few generations
+    N_populations = 25
+    checkpoint_interval = 5
+
+    def checkpoint(population):
+        if population.generation % checkpoint_interval == 0:
+            recorder.flush()
+            save_checkpoint(population, 'population_checkpoint.npz')
+
+    population.run(N_populations, observers=[recorder, checkpoint],
+            log_interval=1)
+
+    recorder.close()
 
-if len(sys.argv) > 1 and sys.argv[1] == 'continue':
-    print 'Continuing on previous simulation'
-    population = pickle.load(open('population_dump', 'r'))    
-    attack_profiles = np.genfromtxt('attackers')
-    defence_profiles = np.genfromtxt('defenders')
-    average_utility = np.genfromtxt('utility')
-    s = population.game.attacker_strategies()
-    t = population.game.defender_strategies()
-    tree = population.game.tree
-
-else:
-    # Generate tree
-    n1 = Node(0)
-    n1.value = 65.0
-    n1.cost_attack = 0.2
-    n1.cost_defence = 0.05
-
-    # The root node is its own parent. Cut value by half to avoid inconsitency
-    n1.parent = 1
-    n1.value = n1.value*0.5
-    
-    ###
-
-    n2 = Node(1)
-    n2.value = 20.0
-    n2.cost_attack = 0.2
-    n2.cost_defence = 0.05
-
-    n3 = Node(2)
-    n3.value = 40.0
-    n3.cost_attack = 0.2
-    n3.cost_defence = 0.05
-
-    n1.add_child(n2)
-    n1.add_child(n3)
-
-    ###
-
-    n4 = Node(3)
-    n4.value = 14.0
-    n4.cost_attack = 0.2
-    n4.cost_defence = 0.05
-
-    n5 = Node(4)
-    n5.value = 6.0
-    n5.cost_attack = 0.2
-    n5.cost_defence = 0.05
-
-    n6 = Node(5)
-    n6.value = 29.0
-    n6.cost_attack = 0.2
-    n6.cost_defence = 0.05
-
-    n7 = Node(6)
-    n7.value = 4.0
-    n7.cost_attack = 0.2
-    n7.cost_defence = 0.05
-
-    n8 = Node(7)
-    n8.value = 15.0
-    n8.cost_attack = 0.2
-    n8.cost_defence = 0.05
-
-    n2.add_child(n4)
-    n2.add_child(n5)
-    n3.add_child(n6)
-    n3.add_child(n7)
-    n3.add_child(n8)
-
-    ###
-
-    n9 = Node(8)
-    n9.value = 1.0
-    n9.cost_attack = 0.2
-    n9.cost_defence = 0.05
-
-    n10 = Node(9)
-    n10.value = 2.0
-    n10.cost_attack = 0.2
-    n10.cost_defence = 0.05
-
-    n11 = Node(10)
-    n11.value = 1.0
-    n11.cost_attack = 0.2
-    n11.cost_defence = 0.05
-
-    n12 = Node(11)
-    n12.value = 5.0
-    n12.cost_attack = 0.2
-    n12.cost_defence = 0.05
-
-    n4.add_child(n9)
-    n4.add_child(n10)
-    n4.add_child(n11)
-    n4.add_child(n12)
-
-    ###
-    
-    n13 = Node(12)
-    n13.value = 3.0
-    n13.cost_attack = 0.2
-    n13.cost_defence = 0.05
-
-    n14 = Node(13)
-    n14.value = 1.5
-    n14.cost_attack = 0.2
-    n14.cost_defence = 0.05
-
-    n5.add_child(n13)
-    n5.add_child(n14)
-
-    ###
-
-    n15 = Node(14)
-    n15.value = 1.0
-    n15.cost_attack = 0.2
-    n15.cost_defence = 0.05
-
-    n16 = Node(15)
-    n16.value = 4.0
-    n16.cost_attack = 0.2
-    n16.cost_defence = 0.05
-
-    n17 = Node(16)
-    n17.value = 6.0
-    n17.cost_attack = 0.2
-    n17.cost_defence = 0.05
-
-    n18 = Node(17)
-    n18.value = 4.0
-    n18.cost_attack = 0.2
-    n18.cost_defence = 0.05
-
-    n19 = Node(18)
-    n19.value = 3.0
-    n19.cost_attack = 0.2
-    n19.cost_defence = 0.05
-
-    n6.add_child(n15)
-    n6.add_child(n16)
-    n6.add_child(n17)
-    n6.add_child(n18)
-    n6.add_child(n19)
-
-    ###
-
-    n20 = Node(19)
-    n20.value = 1.0
-    n20.cost_attack = 0.2
-    n20.cost_defence = 0.05
-
-    n21 = Node(20)
-    n21.value = 1.5
-    n21.cost_attack = 0.2
-    n21.cost_defence = 0.05
-
-    n7.add_child(n20)
-    n7.add_child(n21)
-
-    ###
-
-    n22 = Node(21)
-    n22.value = 3.0
-    n22.cost_attack = 0.2
-    n22.cost_defence = 0.05
-
-    n23 = Node(22)
-    n23.value = 5.0
-    n23.cost_attack = 0.2
-    n23.cost_defence = 0.05
-
-    n24 = Node(23)
-    n24.value = 1.5
-    n24.cost_attack = 0.2
-    n24.cost_defence = 0.05
-
-    n8.add_child(n22)
-    n8.add_child(n23)
-    n8.add_child(n24)
-
-
-    tree = [n1, n2, n3, n4, n5, n6, n7, n8, n9, n10, n11, n12, n13, n14,
-            n15, n16, n17, n18, n19, n20, n21, n22, n23, n24]
-
-    # Initialize game and get strategy spaces
-    game = ConfidentialityGame(tree, K=2, a=0.6, attacker_budget=1.0,
-            defender_budget=4.0)
-
-    print 'Calculating strategy spaces'
-    s = game.attacker_strategies()
-    t = game.defender_strategies()
-
-    # Generate initial populations
-    print 'Setting up initial populations'
-    attacker_population = 1.0/len(s)*np.ones(len(s))
-    defender_population = 1.0/len(t)*np.ones(len(t))
-
-    population = Population(game, attacker_population, defender_population,
-            k=0.2)
-    
-    attack_profiles = np.zeros((0, len(tree)))
-    defence_profiles = np.zeros((0, len(tree)))
-    average_utility = np.zeros((0, 2))
-
-# Evolove population
-N_populations = 25
-for i in range(0, N_populations):
-    print 'Population number '+str(i)
-    # Copy population
-    population.replicate()
-    average_utility = np.append(average_utility,
-            np.array([population.get_average_attacker_utility(),
-                      population.get_average_defender_utility()])[np.newaxis],
-            axis=0)
-    # Calculating attack profile
-    attack_profiles = np.append(attack_profiles, 
-            population.get_attack_profiles()[np.newaxis],
-            axis=0)
-    # Calculating defence profile
-    defence_profiles = np.append(defence_profiles,
-            population.get_defence_profiles()[np.newaxis],
-            axis=0)
-
-np.savetxt('attackers', attack_profiles)
-np.savetxt('defenders', defence_profiles)
-np.savetxt('utility', average_utility)
-
-# Save for future continue
-pickle.dump(population, open('population_dump', 'wb'))
+    # Save for future continue
+    save_checkpoint(population, 'population_checkpoint.npz')
@@ -1,104 +1,170 @@
-import matplotlib.pyplot as plt
+''' Plots the population dynamics of one or more case folders.
+
+Without arguments, the results in the current folder are plotted, saved as
+pdf files and shown. Given result directories, the plots are rendered
+without a display, in parallel worker processes:
+
+    python plot_results.py sweep/run_* --processes 8
+'''
+import argparse
+import matplotlib
 import numpy as np
-from cycler import cycler
+import os
+from concurrent.futures import ProcessPoolExecutor
+from ami_game.recorder import load_trajectory
 
-colors = ['red', 'blue', 'black', 'orange', 'green', 'purple']
 linewidth = 2.0
+type_names = ['HES', 'Collector', 'Meter/Collector', 'Meter']
+# Number of markers drawn on every curve
+markers = 40
+
+def load_results(directory):
+    ''' Returns the attack profiles, defence profiles and average utilities
+    of a case folder, memory-mapped from the binary files of a
+    TrajectoryRecorder or read from the text files of older runs '''
+    if os.path.exists(os.path.join(directory, 'attackers.npy')):
+        return load_trajectory(directory)
+    return tuple(np.genfromtxt(os.path.join(directory, name))
+                 for name in ('attackers', 'defenders', 'utility'))
+
+def indicator_matrices(type_data):
+    ''' Returns the indicator matrices of the node types and levels, i.e.
+    numpy arrays of size <number of nodes in tree> x <number of types> and
+    <number of nodes in tree> x <number of levels> with a one where a node
+    is of a type or on a level, so that profiles are aggregated by a matrix
+    product
+
+    Arguments:
+
+    type_data: numpy array of size <number of nodes in tree> x 2 giving the
+               type and level of every node, as in node_types.txt
+    '''
+    type_data = np.atleast_2d(type_data).astype(int)
+    N = type_data.shape[0]
+    types = np.zeros((N, max(len(type_names), np.max(type_data[:, 0])+1)))
+    types[np.arange(N), type_data[:, 0]] = 1.0
+    levels = np.zeros((N, max(4, np.max(type_data[:, 1])+1)))
+    levels[np.arange(N), type_data[:, 1]] = 1.0
+    return types, levels
+
+def decimate(generations, max_points):
+    ''' Returns the indices of at most about max_points generations, evenly
+    spaced and including the last one '''
+    step = max(1, int(np.ceil(generations/float(max_points))))
+    index = np.arange(0, generations, step)
+    if generations and index[-1] != generations-1:
+        index = np.append(index, generations-1)
+    return index
+
+def plot_series(filename, x, series, labels, ylabel, legend, fmt):
+    ''' Plots the columns of series against x and saves the figure '''
+    import matplotlib.pyplot as plt
+    figure, axes = plt.subplots()
+    markevery = max(1, len(x)//markers)
+    for i in range(0, series.shape[1]):
+        axes.plot(x, series[:, i], marker='o', markevery=markevery,
+                  linewidth=linewidth, label=labels[i])
+    axes.set_ylabel(ylabel)
+    axes.set_xlabel('Generation #')
+    axes.legend(loc=legend)
+    figure.savefig(filename+'.'+fmt)
+    return figure
+
+def plot_directory(directory='.', max_points=2000, fmt='pdf', close=True):
+    ''' Plots the utility evolution and the attack and defence rates by node
+    level and type of a case folder and saves the figures in it
+
+    Arguments:
+
+    directory: the case folder holding the results and node_types.txt
+    max_points: the largest number of generations plotted per curve. Longer
+                trajectories are decimated, which does not change what is
+                visible at screen resolution
+    fmt: the file format of the figures
+    close: if False, the figures are left open, e.g. to be shown
+
+    Returns:
+
+    directory: the case folder
+    '''
+    import matplotlib.pyplot as plt
+    attacker_data, defender_data, utility_data = load_results(directory)
+    types, levels = indicator_matrices(np.genfromtxt(os.path.join(directory,
+            'node_types.txt')))
+    index = decimate(attacker_data.shape[0], max_points)
+    gens = index+1
+    attacker_data = np.asarray(attacker_data[index])
+    defender_data = np.asarray(defender_data[index])
+    utility_data = np.asarray(utility_data[index])
+
+    level_labels = ['Level '+str(i+1) for i in range(0, levels.shape[1])]
+    type_labels = [type_names[i] if i < len(type_names) else str(i)
+                   for i in range(0, types.shape[1])]
+    path = lambda name: os.path.join(directory, name)
+    figures = [
+        plot_series(path('utility_evolution'), gens,
+                    utility_data, ['Attackers', 'Defenders'],
+                    'Average population utility', 'best', fmt),
+        plot_series(path('attack_rate_level_evolution'), gens,
+                    np.dot(attacker_data, levels), level_labels,
+                    'Attack rate', 'upper right', fmt),
+        plot_series(path('attack_rate_type_evolution'), gens,
+                    np.dot(attacker_data, types),
+                    ['Type '+name for name in type_labels],
+                    'Attack rate', 'upper right', fmt),
+        plot_series(path('defence_rate_level_evolution'), gens,
+                    np.dot(defender_data, levels), level_labels,
+                    'Defence rate', 'upper right', fmt),
+        plot_series(path('defence_rate_type_evolution'), gens,
+                    np.dot(defender_data, types),
+                    ['Type: '+name for name in type_labels],
+                    'Defence rate', 'upper right', fmt)]
+    if close:
+        for figure in figures:
+            plt.close(figure)
+    return directory
+
+def _initialize_worker():
+    ''' Selects the non-interactive backend in a worker process '''
+    matplotlib.use('Agg')
+
+def plot_directories(directories, processes=None, max_points=2000,
+                     fmt='pdf'):
+    ''' Plots a list of case folders in parallel worker processes without a
+    display and returns the list of plotted folders '''
+    with ProcessPoolExecutor(max_workers=processes,
+                             initializer=_initialize_worker) as executor:
+        futures = [executor.submit(plot_directory, directory, max_points,
+                                   fmt) for directory in directories]
+        return [future.result() for future in futures]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('directories', nargs='*',
+            help='case folders to plot, the current folder if none given')
+    parser.add_argument('--processes', type=int, default=None,
+            help='number of worker processes (defaults to the number of '
+                 'cores)')
+    parser.add_argument('--max-points', type=int, default=2000,
+            help='largest number of generations plotted per curve')
+    parser.add_argument('--format', default='pdf',
+            help='file format of the figures')
+    parser.add_argument('--no-show', action='store_true',
+            help='do not show the figures of the current folder')
+    arguments = parser.parse_args(argv)
+
+    if arguments.directories:
+        for directory in plot_directories(arguments.directories,
+                arguments.processes, arguments.max_points, arguments.format):
+            print('Plotted '+directory)
+        return
+    if arguments.no_show:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    plot_directory('.', arguments.max_points, arguments.format,
+                   close=arguments.no_show)
+    if not arguments.no_show:
+        plt.show()
 
-# Load data
-attacker_data = np.genfromtxt('attackers')
-defender_data = np.genfromtxt('defenders')
-utility_data = np.genfromtxt('utility')
-type_data = np.genfromtxt('node_types.txt')
-type_names = ['HES','Collector', 'Meter/Collector', 'Meter'] 
-
-generations = attacker_data.shape[0]
-if generations > 40:
-    markfreq = int(generations/40)
-else:
-    markfreq = 1
-
-attacker_data_type = np.zeros((generations, 4))
-attacker_data_level = np.zeros((generations, 4))
-
-defender_data_type = np.zeros((generations, 4))
-defender_data_level = np.zeros((generations, 4))
-
-for i in range(0, attacker_data.shape[1]):
-    attacker_data_type[:, int(type_data[i, 0])] += attacker_data[:, i]
-    attacker_data_level[:, int(type_data[i, 1])] += attacker_data[:, i]
-
-for i in range(0, defender_data.shape[1]):
-    defender_data_type[:, int(type_data[i, 0])] += defender_data[:, i]
-    defender_data_level[:, int(type_data[i, 1])] += defender_data[:, i]
-
-# Utility evolution
-plt.figure(3)
-gens = range(1, utility_data.shape[0]+1) 
-plt.plot(gens, utility_data[:, 0], marker='o', 
-        markevery=markfreq,
-        linewidth=linewidth,
-            label='Attackers')
-plt.plot(gens, utility_data[:, 1], marker='o', 
-        markevery=markfreq,
-        linewidth=linewidth,
-            label='Defenders')
-
-plt.ylabel('Average population utility')
-plt.xlabel('Generation #')
-plt.legend(loc='best')
-plt.savefig('utility_evolution.pdf')
-
-# Attacker level evolution
-plt.figure(4) 
-for i in range(0, attacker_data_level.shape[1]):
-    gens = range(1, generations+1) 
-    plt.plot(gens, attacker_data_level[:, i], marker='o',
-            markevery=markfreq,
-            linewidth=linewidth,
-                label='Level '+str(i+1))
-plt.ylabel('Attack rate')
-plt.xlabel('Generation #')
-plt.legend(loc='upper right')
-plt.savefig('attack_rate_level_evolution.pdf')
-
-# Attacker type evolution
-plt.figure(5) 
-for i in range(0, attacker_data_type.shape[1]):
-    gens = range(1, generations+1) 
-    plt.plot(gens, attacker_data_type[:, i], marker='o',
-            markevery=markfreq,
-            linewidth=linewidth,
-                label='Type '+type_names[i])
-plt.ylabel('Attack rate')
-plt.xlabel('Generation #')
-plt.legend(loc='upper right')
-plt.savefig('attack_rate_type_evolution.pdf')
-
-# Defender level evolution
-plt.figure(6) 
-for i in range(0, defender_data_level.shape[1]):
-    gens = range(1, generations+1) 
-    plt.plot(gens, defender_data_level[:, i], marker='o',
-            markevery=markfreq,
-            linewidth=linewidth,
-                label='Level '+str(i+1))
-plt.ylabel('Defence rate')
-plt.xlabel('Generation #')
-plt.legend(loc='upper right')
-plt.savefig('defence_rate_level_evolution.pdf')
-
-# Defender type evolution
-plt.figure(7) 
-for i in range(0, defender_data_type.shape[1]):
-    gens = range(1, generations+1) 
-    plt.plot(gens, defender_data_type[:, i], marker='o',
-            markevery=markfreq,
-            linewidth=linewidth,
-            label='Type: '+type_names[i])
-plt.ylabel('Defence rate')
-plt.xlabel('Generation #')
-plt.legend(loc='upper right')
-plt.savefig('defence_rate_type_evolution.pdf')
-
-plt.show()
+if __name__ == '__main__':
+    main()